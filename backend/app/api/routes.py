@@ -1,7 +1,13 @@
 from fastapi import APIRouter, HTTPException, UploadFile, File, Query
 from app.services.csv_delta_service import compute_csv_delta
 from app.services.json_delta_service import compute_json_delta  # <--- NEW SERVICE IMPORT
-from app.services.ingest_service import ingest_events_into_qdrant, COLLECTION_NAME
+from app.services.ingest_service import (
+    ingest_events_into_qdrant,
+    COLLECTION_NAME,
+    get_dense_model,
+    get_sparse_model,
+    l2_normalize,
+)
 from app.services.openroute_service import geocode_address, get_route
 from app.services.qdrant_service import (
     build_geo_filter,
@@ -22,17 +28,14 @@ from shapely.geometry import LineString, Point
 import numpy as np
 import geopandas as gpd
 from app.core.config import (
-    DENSE_MODEL_NAME,
-    SPARSE_MODEL_NAME,
     QDRANT_SERVER,
     QDRANT_API_KEY,
     UNPLI_SESSION_ID,
 )
-from fastembed import TextEmbedding, SparseTextEmbedding
 import os
-import json
+import asyncio
+import orjson
 import shutil
-import httpx
 import logging
 from app.services import tm_service
 from app.services import lombardia_service
@@ -55,9 +58,7 @@ DATASET_DIR.mkdir(parents=True, exist_ok=True)
 
 
 
-# Shared AI Models (Initialized with 1 thread for memory safety)
-dense_embedding_model = TextEmbedding(DENSE_MODEL_NAME, threads=1)
-sparse_embedding_model = SparseTextEmbedding(SPARSE_MODEL_NAME, threads=1)
+# Shared AI Models: the ingest_service instances (1 thread each), so each ONNX model is loaded once
 
 # ---------- ENDPOINTS ----------
 # --- THIS IS TO OBTAIN THE SINGLE EVENT ----
@@ -131,38 +132,39 @@ async def trigger_unpli_scrape(
     try:
         current_session_id = session_id or UNPLI_SESSION_ID
         
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            # 1. Fetch raw events
-            logger.info(f"📡 Fetching UNPLI page {page_no} (size {page_size})...")
-            raw_events = await scrape.fetch_unpli_events(
-                session=client,
-                page_no=page_no,
-                page_size=page_size,
-                session_id=current_session_id
-            )
-            
-            if not raw_events:
-                return {"status": "error", "message": "No events returned from API", "events": []}
-
-            # 2. Transform events for JSON format
-            logger.info(f"⚙️ Transforming {len(raw_events)} raw events...")
-            transformed_events = await scrape.transform_events_for_json(
-                events=raw_events,
-                session_id=current_session_id
-            )
-            
-            # 3. Save to disk (updated to clean YYYY-MM-DD format)
-            output_file = DATASET_DIR / f"unpli_events_{datetime.now().strftime('%Y-%m-%d')}.json"
-            with open(output_file, "w", encoding="utf-8") as f:
-                json.dump({"events": transformed_events}, f, indent=2, ensure_ascii=False)
-
-            return {
-                "status": "success",
-                "count": len(transformed_events),
-                "file_saved": str(output_file),
-                "events": transformed_events
-            }
-            
+        # Shared keep-alive (HTTP/2) client for both the page fetch and the detail lookups
+        client = scrape.unpli_http_client
+        # 1. Fetch raw events
+        logger.info(f"📡 Fetching UNPLI page {page_no} (size {page_size})...")
+        raw_events = await scrape.fetch_unpli_events(
+            session=client,
+            page_no=page_no,
+            page_size=page_size,
+            session_id=current_session_id
+        )
+        
+        if not raw_events:
+            return {"status": "error", "message": "No events returned from API", "events": []}
+
+        # 2. Transform events for JSON format
+        logger.info(f"⚙️ Transforming {len(raw_events)} raw events...")
+        transformed_events = await scrape.transform_events_for_json(
+            events=raw_events,
+            session_id=current_session_id,
+            session=client
+        )
+        
+        # 3. Save to disk (updated to clean YYYY-MM-DD format)
+        output_file = DATASET_DIR / f"unpli_events_{datetime.now().strftime('%Y-%m-%d')}.json"
+        output_file.write_bytes(orjson.dumps({"events": transformed_events}, option=orjson.OPT_INDENT_2))
+
+        return {
+            "status": "success",
+            "count": len(transformed_events),
+            "file_saved": str(output_file),
+            "events": transformed_events
+        }
+        
     except Exception as e:
         logger.error(f"❌ Scraping orchestration failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -219,8 +221,7 @@ async def ingest_tm_delta(country: str = Query("IT")):
         logger.info(f"⚙️ Trasformazione in corso per {country}...")
         standardized_events = tm_service.load_and_transform_tm_file(current_raw)
         
-        with open(current_std, "w", encoding="utf-8") as f:
-            json.dump({"events": standardized_events}, f, indent=2)
+        current_std.write_bytes(orjson.dumps({"events": standardized_events}, option=orjson.OPT_INDENT_2))
 
         # 2. CALCOLO DELTA
         # Se last_std non esiste (es. --initialize), compute_json_delta 
@@ -281,8 +282,7 @@ async def ingest_feratel():
         logger.info("⚙️ Transforming raw Feratel XML to JSON...")
         standardized_events = feratel_service.parse_feratel_data(raw_events, raw_keyvalues)
         
-        with open(current_std, "w", encoding="utf-8") as f:
-            json.dump({"events": standardized_events}, f, indent=2, ensure_ascii=False)
+        current_std.write_bytes(orjson.dumps({"events": standardized_events}, option=orjson.OPT_INDENT_2))
 
         # 2. DELTA CALCULATION (Comparing Current vs Last)
         logger.info("🔍 Checking for updates (Delta)...")
@@ -331,8 +331,7 @@ async def ingest_lombardia_delta(initialize: bool = Query(False)):
         raw_data = await lombardia_service.fetch_lombardia_raw()
         standardized_events = lombardia_service.transform_lombardia_data(raw_data)
         
-        with open(current_std, "w", encoding="utf-8") as f:
-            json.dump({"events": standardized_events}, f, indent=2, ensure_ascii=False)
+        current_std.write_bytes(orjson.dumps({"events": standardized_events}, option=orjson.OPT_INDENT_2))
 
         # 2. CALCOLO DELTA
         delta_events = compute_json_delta(last_std, current_std)
@@ -391,7 +390,7 @@ async def process_ticketsqueeze_delta(
         )
         
         output_json_path = DATASET_DIR / "ts_delta_delta.json"
-        ticketsqueeze.save_events_to_json(result["events"], output_json_path)
+        await ticketsqueeze.save_events_to_json(result["events"], output_json_path)
         
         return {
             "status": "success", 
@@ -413,8 +412,7 @@ async def ingest_ticketsqueeze_delta(file: UploadFile = File(...)):
         with open(save_path, "wb") as buffer:
             shutil.copyfileobj(file.file, buffer)
 
-        with open(save_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        data = orjson.loads(save_path.read_bytes())
 
         events = data if isinstance(data, list) else data.get("events", [])
         result = await ingest_events_into_qdrant(events)
@@ -429,16 +427,23 @@ async def ingest_ticketsqueeze_delta(file: UploadFile = File(...)):
 @router.post("/create_map")
 async def create_event_map(request: schemas.RouteRequest):
     try:
-        origin_lon, origin_lat = geocode_address(request.origin_address)
+        # geocode_address/get_route do blocking HTTP + SQLite: run them in worker threads,
+        # origin and destination concurrently
+        if request.destination_address:
+            (origin_lon, origin_lat), (dest_lon, dest_lat) = await asyncio.gather(
+                asyncio.to_thread(geocode_address, request.origin_address),
+                asyncio.to_thread(geocode_address, request.destination_address),
+            )
+        else:
+            origin_lon, origin_lat = await asyncio.to_thread(geocode_address, request.origin_address)
         origin_point_sh = Point(origin_lon, origin_lat)
         route_coords = []
         destination_data = None
         
         if request.destination_address:
-            dest_lon, dest_lat = geocode_address(request.destination_address)
             destination_data = {"lat": dest_lat, "lon": dest_lon, "address": request.destination_address}
             coords = [[origin_lon, origin_lat], [dest_lon, dest_lat]]
-            routes = get_route(coords, profile=request.profile_choice)
+            routes = await asyncio.to_thread(get_route, coords, profile=request.profile_choice)
             route_geometry = routes["features"][0]["geometry"]
             route_coords = route_geometry["coordinates"]
             if len(route_coords) < 2:
@@ -467,10 +472,16 @@ async def create_event_map(request: schemas.RouteRequest):
         final_filter = build_final_filter(geo_filter, date_filter)
 
         score_threshold = 0.0 if request.query_text.strip() == "" else 0.34
-        query_dense_vector = list(dense_embedding_model.passage_embed([request.query_text]))[0].tolist()
-        query_sparse_embedding = list(sparse_embedding_model.passage_embed([request.query_text]))[0]
+        # Off the event loop; only the dense encoder (ONNX Runtime) releases the GIL, so the
+        # pure-Python BM25 tokenization overlaps with it but not with other Python work
+        dense_embedding, query_sparse_embedding = await asyncio.gather(
+            asyncio.to_thread(lambda: next(iter(get_dense_model().passage_embed([request.query_text])))),
+            asyncio.to_thread(lambda: next(iter(get_sparse_model().passage_embed([request.query_text])))),
+        )
+        query_dense_vector = l2_normalize(dense_embedding).tolist()
 
-        payloads = query_events_hybrid(
+        payloads = await asyncio.to_thread(
+            query_events_hybrid,
             dense_vector=query_dense_vector,
             sparse_vector=query_sparse_embedding,
             query_filter=final_filter,
@@ -507,7 +518,7 @@ async def create_event_map(request: schemas.RouteRequest):
 @router.post("/sentencetopayload")
 async def sentence_to_payload(data: SentenceInput):
     try:
-        output = extract_payload(data.sentence)
+        output = await extract_payload(data.sentence)
         return output.model_dump() if hasattr(output, "model_dump") else output
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -8,6 +8,8 @@ load_dotenv(dotenv_path="../.env")
 QDRANT_SERVER = os.getenv("QDRANT_SERVER")
 QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
 COLLECTION_NAME = os.getenv("COLLECTION_NAME")
+# Opt-in: gRPC (port 6334) for faster bulk ingest, only if the server exposes it
+QDRANT_PREFER_GRPC = os.getenv("QDRANT_PREFER_GRPC", "false").lower() == "true"
 
 # --- AI & EMBEDDING MODELS ---
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
@@ -28,6 +30,8 @@ PHOTON_CONTACT_EMAIL = os.getenv("PHOTON_CONTACT_EMAIL")
 UNPLI_SESSION_ID = os.getenv("UNPLI_SESSION_ID")
 UNPLI_API_BASE_URL = os.getenv("UNPLI_API_BASE_URL")
 UNPLI_WEB_BASE_URL = os.getenv("UNPLI_WEB_BASE_URL")
+# Requests/second to the UNPLI API (2 = the historical 0.5 s pause); raise only if allowed
+UNPLI_MAX_RPS = float(os.getenv("UNPLI_MAX_RPS", "2"))
 
 # --- TICKETMASTER & AFFILIATE ---
 # Legge il link di Impact direttamente dal .env senza default nel codice
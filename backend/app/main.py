@@ -1,10 +1,14 @@
 import logging
 import os
+from contextlib import asynccontextmanager
 from logging.handlers import TimedRotatingFileHandler
 from fastapi import FastAPI
 from fastapi.responses import ORJSONResponse
 from app.api.routes import router
+from app.services.ingest_service import geocode_http_client, client as ingest_qdrant_client
+from app.services.scrape import unpli_http_client
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 
 # Log to ./backend/logs/app.log (works everywhere)
 log_dir = "./logs"
@@ -26,8 +30,18 @@ for name in ("uvicorn", "uvicorn.error", "uvicorn.access", "httpx"):
     lg.propagate = True
     lg.setLevel(logging.INFO)
 
-app = FastAPI(default_response_class=ORJSONResponse)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    await geocode_http_client.aclose()
+    await unpli_http_client.aclose()
+    await ingest_qdrant_client.close()
+
+app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
 app.include_router(router)
+# create_map responses carry the full route polyline + event descriptions: gzip them
+# (the frontend's requests session sends Accept-Encoding: gzip); tiny replies stay plain
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=6)
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_credentials=True, allow_methods=["*"], allow_headers=["*"])
 
 logging.info(f"🚀 Logs → {os.path.abspath(log_file)}")
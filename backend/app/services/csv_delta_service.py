@@ -1,8 +1,13 @@
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
 from pathlib import Path
 from fastapi import HTTPException, UploadFile
-from typing import List
+from typing import Iterator, List, Tuple
+from functools import lru_cache
 import io
+import csv
 import tempfile
 import os
 
@@ -15,6 +20,86 @@ def detect_key(df: pd.DataFrame) -> List[str]:
     return [df.columns[0]]
 
 
+ARROW_WRITE_MIN_ROWS = 10_000
+
+
+@lru_cache(maxsize=32)
+def delta_schema(old_cols: Tuple[str, ...], new_cols: Tuple[str, ...], key_cols: Tuple[str, ...]):
+    """Column layout for the changed-rows comparison; the daily feeds reuse one schema."""
+    all_cols = list(dict.fromkeys(old_cols + new_cols))
+    non_key_cols = [c for c in all_cols if c not in key_cols]
+    return all_cols, non_key_cols, old_cols == new_cols
+
+# Same tokens pandas.read_csv treats as missing, so both parsers agree.
+_CSV_NULL_VALUES = [
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+]
+
+
+def _csv_header(first_line: bytes) -> List[str]:
+    return next(csv.reader([first_line.rstrip(b"\r\n").decode("utf-8-sig")]), [])
+
+
+def _arrow_string_options(header: List[str]) -> dict:
+    return dict(
+        parse_options=pacsv.ParseOptions(newlines_in_values=True),
+        # Explicit string types: type inference would turn IDs like "007" into 7
+        convert_options=pacsv.ConvertOptions(
+            column_types={c: pa.string() for c in header},
+            null_values=_CSV_NULL_VALUES,
+            strings_can_be_null=True,
+        ),
+    )
+
+
+def read_csv_as_strings(content: bytes) -> pd.DataFrame:
+    """Read CSV bytes as all-string columns, preferring the multithreaded PyArrow parser."""
+    header = _csv_header(content.split(b"\n", 1)[0])
+    try:
+        df = pacsv.read_csv(io.BytesIO(content), **_arrow_string_options(header)).to_pandas()
+    except (pa.ArrowInvalid, UnicodeDecodeError):
+        df = pd.read_csv(io.BytesIO(content), dtype=str)
+    return df.fillna("")
+
+
+CSV_STREAM_BLOCK_BYTES = 16 << 20
+CSV_STREAM_CHUNK_ROWS = 50_000
+
+
+def _iter_pandas_chunks(csv_path: Path, skip_rows: int = 0) -> Iterator[pd.DataFrame]:
+    for chunk in pd.read_csv(csv_path, dtype=str, chunksize=CSV_STREAM_CHUNK_ROWS):
+        if skip_rows >= len(chunk):
+            skip_rows -= len(chunk)
+            continue
+        yield chunk.iloc[skip_rows:].fillna("")
+        skip_rows = 0
+
+
+def iter_csv_as_strings(csv_path: Path) -> Iterator[pd.DataFrame]:
+    """
+    read_csv_as_strings for a file, one batch at a time (~16 MB of CSV each):
+    peak memory follows the batch, not the whole file.
+    """
+    with open(csv_path, "rb") as f:
+        header = _csv_header(f.readline())
+    rows_yielded = 0
+    try:
+        reader = pacsv.open_csv(
+            csv_path,
+            read_options=pacsv.ReadOptions(block_size=CSV_STREAM_BLOCK_BYTES),
+            **_arrow_string_options(header),
+        )
+        for batch in reader:
+            df = batch.to_pandas().fillna("")
+            rows_yielded += len(df)
+            yield df
+    except (pa.ArrowInvalid, UnicodeDecodeError):
+        # A malformed row can surface in any block, after earlier batches were consumed:
+        # the lenient pandas parser takes over from the first row not yet yielded
+        yield from _iter_pandas_chunks(csv_path, skip_rows=rows_yielded)
+
+
 def compute_csv_delta(
     old_csv_content: bytes,
     new_csv_content: bytes,
@@ -30,8 +115,8 @@ def compute_csv_delta(
     - csv_path: path to saved CSV if output_path provided
     """
     # Read CSVs as strings to preserve exact values
-    df_old = pd.read_csv(io.BytesIO(old_csv_content), dtype=str).fillna("")
-    df_new = pd.read_csv(io.BytesIO(new_csv_content), dtype=str).fillna("")
+    df_old = read_csv_as_strings(old_csv_content)
+    df_new = read_csv_as_strings(new_csv_content)
 
     key_cols = [k.strip() for k in keys.split(",")] if keys else detect_key(df_old)
 
@@ -51,32 +136,16 @@ def compute_csv_delta(
     removed_idx = idx_old.difference(idx_new)
     common_idx = idx_old.intersection(idx_new)
 
-    records = []
-
-    def prefix_df(df: pd.DataFrame, prefix: str, keep_keys: List[str]) -> pd.DataFrame:
-        df_copy = df.copy()
-        cols = []
-        for c in df_copy.columns:
-            if c in keep_keys:
-                cols.append(c)
-            else:
-                df_copy.rename(columns={c: f"{prefix}{c}"}, inplace=True)
-                cols.append(f"{prefix}{c}")
-        return df_copy[cols]
+    # Each section: (delta_type, [(frame, column prefix), ...]) laid side by side
+    sections = []
 
     # Added records
     if len(added_idx) > 0:
-        added = df_new_idx.loc[added_idx].reset_index(drop=True)
-        added_pref = prefix_df(added, "new_", key_cols)
-        added_pref["delta_type"] = "added"
-        records.append(added_pref)
+        sections.append(("added", [(df_new_idx.loc[added_idx], "new_")]))
 
     # Removed records
     if len(removed_idx) > 0:
-        removed = df_old_idx.loc[removed_idx].reset_index(drop=True)
-        removed_pref = prefix_df(removed, "old_", key_cols)
-        removed_pref["delta_type"] = "removed"
-        records.append(removed_pref)
+        sections.append(("removed", [(df_old_idx.loc[removed_idx], "old_")]))
 
     # Changed records
     diff_mask_sum = 0
@@ -84,24 +153,21 @@ def compute_csv_delta(
         left = df_old_idx.loc[common_idx].sort_index()
         right = df_new_idx.loc[common_idx].sort_index()
 
-        all_cols = list(dict.fromkeys(list(left.columns) + list(right.columns)))
-        left = left.reindex(columns=all_cols, fill_value="")
-        right = right.reindex(columns=all_cols, fill_value="")
+        all_cols, non_key_cols, same_schema = delta_schema(tuple(left.columns), tuple(right.columns), tuple(key_cols))
+        if not same_schema:
+            left = left.reindex(columns=all_cols, fill_value="")
+            right = right.reindex(columns=all_cols, fill_value="")
 
-        non_key_cols = [c for c in all_cols if c not in key_cols]
-        diff_mask = (left[non_key_cols] != right[non_key_cols]).any(axis=1)
+        # Single 2D comparison on numpy object arrays (no intermediate DataFrame)
+        left_vals = left[non_key_cols].to_numpy(dtype=object)
+        right_vals = right[non_key_cols].to_numpy(dtype=object)
+        diff_mask = (left_vals != right_vals).any(axis=1)
         diff_mask_sum = diff_mask.sum()
-        
+
         if diff_mask.any():
-            left_diff = left[diff_mask].reset_index(drop=True)
-            right_diff = right[diff_mask].reset_index(drop=True)
-            left_pref = prefix_df(left_diff, "old_", key_cols)
-            right_pref = prefix_df(right_diff, "new_", key_cols)
-            combined = pd.concat([left_pref, right_pref.drop(columns=key_cols, errors="ignore")], axis=1)
-            combined["delta_type"] = "changed"
-            records.append(combined)
-
-    if not records:
+            sections.append(("changed", [(left.iloc[diff_mask], "old_"), (right.iloc[diff_mask], "new_")]))
+
+    if not sections:
         empty_df = pd.DataFrame(columns=["event_id", "delta_type"])
         return {
             "delta_df": empty_df,
@@ -109,14 +175,28 @@ def compute_csv_delta(
             "csv_path": None
         }
 
-    # Combine and reorder
-    df_all = pd.concat(records, ignore_index=True, sort=False)
-    df_all = df_all.fillna("")
-    
-    rest_cols = [c for c in df_all.columns if c not in key_cols + ["delta_type"]]
-    ordered = list(key_cols) + ["delta_type"] + rest_cols
-    ordered = [c for c in ordered if c in df_all.columns]
-    df_all = df_all[ordered]
+    # Output layout: keys, delta_type, then prefixed columns in first-seen order
+    rest_cols = [f"{prefix}{c}" for _, frames in sections for frame, prefix in frames for c in frame.columns if c not in key_cols]
+    ordered = list(key_cols) + ["delta_type"] + list(dict.fromkeys(rest_cols))
+
+    # Fill one preallocated array per column instead of concat + fillna + reorder copies
+    n_rows = sum(len(frames[0][0]) for _, frames in sections)
+    out = {c: np.full(n_rows, "", dtype=object) for c in ordered}
+
+    offset = 0
+    for delta_type, frames in sections:
+        stop = offset + len(frames[0][0])
+        out["delta_type"][offset:stop] = delta_type
+        for pos, (frame, prefix) in enumerate(frames):
+            for c in frame.columns:
+                if c not in key_cols:
+                    out[f"{prefix}{c}"][offset:stop] = frame[c].to_numpy(dtype=object)
+                elif pos == 0:
+                    # Keys are taken from the first frame of each section only
+                    out[c][offset:stop] = frame[c].to_numpy(dtype=object)
+        offset = stop
+
+    df_all = pd.DataFrame(out, columns=ordered)
 
     # ✅ FIX: Forziamo la conversione in int (Python native) per evitare errori di serializzazione JSON
     summary = {
@@ -135,7 +215,11 @@ def compute_csv_delta(
     # Save to file if path provided
     if output_path:
         output_path.parent.mkdir(parents=True, exist_ok=True)
-        df_all.to_csv(output_path, index=False)
+        if len(df_all) > ARROW_WRITE_MIN_ROWS:
+            # Multithreaded C++ writer; pandas' per-row formatter is fine for small deltas
+            pacsv.write_csv(pa.Table.from_pandas(df_all, preserve_index=False), str(output_path))
+        else:
+            df_all.to_csv(output_path, index=False)
         result["csv_path"] = str(output_path)
 
     return result
\ No newline at end of file
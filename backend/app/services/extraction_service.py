@@ -1,10 +1,18 @@
 #import json
-from typing import Optional, Literal
+import asyncio
+import logging
+import threading
+import blake3
+from functools import lru_cache
+from typing import Optional, Literal, Dict
 from pydantic import BaseModel, ValidationError, model_validator, Field, field_validator
 from datetime import datetime, timedelta
 from crewai import Agent, Task, Crew, Process, LLM
+from openai import AsyncOpenAI
 from app.core.config import OPENAI_API_KEY, OPEN_AI_BASE_URL, OPENAI_MODEL
 
+logger = logging.getLogger(__name__)
+
 
 customllm = LLM(
     model=OPENAI_MODEL,
@@ -56,17 +64,37 @@ class Payload(BaseModel):
         return model
 
 
+EXTRACTION_GOAL = (
+    "Given an input sentence, extract ONLY the following fields as JSON: "
+    "origin_address, destination_address, buffer_distance (in km), startinputdate (ISO 8601 date-time string for departure), "
+    "endinputdate (ISO 8601 date-time string for arrival), query_text (search keywords found after phrases like 'about', 'on', or 'for', else default ''), "
+    "numevents (integer), profile_choice (one of 'driving-car', 'cycling-regular', 'foot-walking'; default 'driving-car'). "
+    "You must parse these fields dynamically from the input sentence provided via 'input' variable. "
+    "Do not return default or example values unless they appear explicitly in the input sentence. "
+    "Output ONLY the JSON object, no additional commentary."
+)
+
+EXTRACTION_INSTRUCTIONS = (
+    "Extract the payload data from this input sentence dynamically:\n"
+    "{input}\n\n"
+    "Return ONLY a JSON object matching the following format (with profile_choice restricted to specific values):\n"
+    '{\n'
+    '  "origin_address": "Padova",\n'
+    '  "destination_address": "Venice",\n'
+    '  "buffer_distance": 6.0,\n'
+    '  "startinputdate": "2025-09-03T06:00:00",\n'
+    '  "endinputdate": "2025-09-07T15:00:00",\n'
+    '  "query_text": "",\n'  # empty string default here
+    '  "numevents": 13,\n'
+    '  "profile_choice": "driving-car"\n'
+    '}\n'
+    "Use the values from the input sentence above, not the example values here. Extract query_text from phrases like 'about music', 'on theater', 'for workshop', etc. If no such keywords found, set query_text to an empty string."
+)
+
+
 agent = Agent(
     role="Payload Extractor",
-    goal=(
-        "Given an input sentence, extract ONLY the following fields as JSON: "
-        "origin_address, destination_address, buffer_distance (in km), startinputdate (ISO 8601 date-time string for departure), "
-        "endinputdate (ISO 8601 date-time string for arrival), query_text (search keywords found after phrases like 'about', 'on', or 'for', else default ''), "
-        "numevents (integer), profile_choice (one of 'driving-car', 'cycling-regular', 'foot-walking'; default 'driving-car'). "
-        "You must parse these fields dynamically from the input sentence provided via 'input' variable. "
-        "Do not return default or example values unless they appear explicitly in the input sentence. "
-        "Output ONLY the JSON object, no additional commentary."
-    ),
+    goal=EXTRACTION_GOAL,
     backstory="Expert at precise structured extraction from unstructured text sentences.",
     tools=[],
     llm=customllm,
@@ -76,22 +104,7 @@ agent = Agent(
 
 
 task = Task(
-    description=(
-        "Extract the payload data from this input sentence dynamically:\n"
-        "{input}\n\n"
-        "Return ONLY a JSON object matching the following format (with profile_choice restricted to specific values):\n"
-        '{\n'
-        '  "origin_address": "Padova",\n'
-        '  "destination_address": "Venice",\n'
-        '  "buffer_distance": 6.0,\n'
-        '  "startinputdate": "2025-09-03T06:00:00",\n'
-        '  "endinputdate": "2025-09-07T15:00:00",\n'
-        '  "query_text": "",\n'  # empty string default here
-        '  "numevents": 13,\n'
-        '  "profile_choice": "driving-car"\n'
-        '}\n'
-        "Use the values from the input sentence above, not the example values here. Extract query_text from phrases like 'about music', 'on theater', 'for workshop', etc. If no such keywords found, set query_text to an empty string."
-    ),
+    description=EXTRACTION_INSTRUCTIONS,
     expected_output="A JSON object matching the Payload pydantic model with profile_choice and dynamic query_text.",
     agent=agent,
     output_json=Payload,
@@ -106,11 +119,89 @@ crew = Crew(
 )
 
 
-def extract_payload(sentence: str):
-    result = crew.kickoff(inputs={"input": sentence})
+# Direct JSON-schema call: one round-trip, no agent scratchpad. CrewAI stays as fallback.
+# Built on first use: without OPENAI_API_KEY the constructor raises, which should only fail
+# the direct path (falling back to CrewAI), not the backend import.
+@lru_cache(maxsize=1)
+def get_openai_client() -> AsyncOpenAI:
+    return AsyncOpenAI(base_url=OPEN_AI_BASE_URL, api_key=OPENAI_API_KEY)
+
+
+# OPENAI_MODEL uses LiteLLM routing names (e.g. "openrouter/mistralai/..."); the
+# OpenAI-compatible endpoint expects the bare model id.
+DIRECT_MODEL = OPENAI_MODEL.split("/", 1)[1] if OPENAI_MODEL and OPENAI_MODEL.split("/", 1)[0] in ("openai", "openrouter") else OPENAI_MODEL
+
+PAYLOAD_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "Payload", "schema": Payload.model_json_schema()},
+}
+
+
+async def extract_payload_direct(sentence: str) -> Payload:
+    response = await get_openai_client().chat.completions.create(
+        model=DIRECT_MODEL,
+        temperature=0.0,
+        response_format=PAYLOAD_RESPONSE_FORMAT,
+        messages=[
+            {"role": "system", "content": EXTRACTION_GOAL},
+            {"role": "user", "content": EXTRACTION_INSTRUCTIONS.replace("{input}", sentence)},
+        ],
+    )
+    return Payload.model_validate_json(response.choices[0].message.content)
+
+
+# crew.kickoff interpolates the input into the shared task (description, outputs) in
+# place: fallback runs in worker threads must not overlap
+_crew_lock = threading.Lock()
+
+
+def _kickoff_crew(sentence: str):
+    with _crew_lock:
+        return crew.kickoff(inputs={"input": sentence})
+
+
+# Identical sentences (UI re-submits) share one in-flight/cached result for a while
+PAYLOAD_CACHE_TTL = 600
+_payload_cache: Dict[str, asyncio.Future] = {}
+
+
+async def _extract_payload_uncached(sentence: str):
+    try:
+        return await extract_payload_direct(sentence)
+    except Exception as e:
+        logger.warning(f"⚠️ Direct extraction failed, falling back to CrewAI: {e}")
+
+    result = await asyncio.to_thread(_kickoff_crew, sentence)
     try:
         payload = Payload.model_validate(result.to_dict())
         return payload
     except ValidationError as e:
         print("Validation failed:", e)
         return None
+
+
+async def extract_payload(sentence: str):
+    key = blake3.blake3(sentence.encode()).hexdigest()
+    future = _payload_cache.get(key)
+    if future is not None:
+        return await asyncio.shield(future)
+
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    _payload_cache[key] = future
+    try:
+        payload = await _extract_payload_uncached(sentence)
+    except BaseException as e:
+        # Includes cancellation of the leader: waiters must not hang on an unresolved future
+        _payload_cache.pop(key, None)
+        future.set_exception(e)
+        future.exception()  # mark retrieved when nobody else is waiting
+        raise
+
+    future.set_result(payload)
+    if payload is None:
+        # Don't keep failed extractions around
+        _payload_cache.pop(key, None)
+    else:
+        loop.call_later(PAYLOAD_CACHE_TTL, _payload_cache.pop, key, None)
+    return payload
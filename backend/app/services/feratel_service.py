@@ -43,7 +43,8 @@ def get_text_agnostic(element: ET.Element, tag_name: str) -> str:
 def parse_date_time(date_str: str, time_str: str = "") -> str:
     """Genera un timestamp ISO 8601."""
     try:
-        dt = datetime.strptime(date_str, "%Y-%m-%d")
+        # fromisoformat is C (~100x faster than strptime) for the usual zero-padded date
+        dt = datetime.fromisoformat(date_str) if len(date_str) == 10 else datetime.strptime(date_str, "%Y-%m-%d")
         if time_str:
             h, m = map(int, time_str.split(":")[:2])
             dt = dt.replace(hour=h, minute=m)
@@ -1,19 +1,26 @@
 import os
-import json
+import sys
+import orjson
 import asyncio
 import logging
 import uuid
 import sqlite3
+import threading
 import hashlib
+import blake3
 import time
 import unicodedata
 import httpx
+import numpy as np
+import pandas as pd
 from typing import Optional, Dict, Any, List, Tuple
+from functools import lru_cache
 from pathlib import Path
 from fastembed import TextEmbedding, SparseTextEmbedding
-from qdrant_client import QdrantClient, models
-from app.core.config import QDRANT_SERVER, QDRANT_API_KEY, DENSE_MODEL_NAME, SPARSE_MODEL_NAME, COLLECTION_NAME
-from tqdm import tqdm
+from qdrant_client import AsyncQdrantClient, models
+from app.services.rate_limiter import RateLimiter
+from app.core.config import QDRANT_SERVER, QDRANT_API_KEY, QDRANT_PREFER_GRPC, DENSE_MODEL_NAME, SPARSE_MODEL_NAME, COLLECTION_NAME
+from tqdm.asyncio import tqdm_asyncio
 
 # --- STORAGE ---
 if os.path.exists("/app/dataset"):
@@ -46,22 +53,118 @@ def init_cache_db():
 
 init_cache_db()
 
-dense_embedding_model = TextEmbedding(DENSE_MODEL_NAME, threads=1)
-sparse_embedding_model = SparseTextEmbedding(SPARSE_MODEL_NAME, threads=1)
-client = QdrantClient(url=QDRANT_SERVER, api_key=QDRANT_API_KEY, timeout=300)
+# Models load on first use (not at import): each ONNX session costs hundreds of MB and seconds of boot
+@lru_cache(maxsize=1)
+def get_dense_model() -> TextEmbedding:
+    return TextEmbedding(DENSE_MODEL_NAME, threads=1)
+
+@lru_cache(maxsize=1)
+def get_sparse_model() -> SparseTextEmbedding:
+    return SparseTextEmbedding(SPARSE_MODEL_NAME, threads=1)
+
+# Async client: Qdrant round-trips don't block the event loop serving other requests
+client = AsyncQdrantClient(url=QDRANT_SERVER, api_key=QDRANT_API_KEY, prefer_grpc=QDRANT_PREFER_GRPC, timeout=300)
 
 DENSE_VECTOR_NAME = "dense_vector"
+ID_NAMESPACE = uuid.NAMESPACE_DNS
+PAYLOAD_INDEXES = {
+    "id": models.PayloadSchemaType.KEYWORD,
+    "location": models.PayloadSchemaType.GEO,
+    "start_date": models.PayloadSchemaType.DATETIME,
+    "end_date": models.PayloadSchemaType.DATETIME,
+}
+# Set after the first successful existence check/creation: later ingests skip the round-trip
+collection_ready = False
 SPARSE_VECTOR_NAME = "sparse_vector"
+RETRIEVE_CHUNK_SIZE = 1_000
+# Concurrent retrieve requests while looking up existing points
+RETRIEVE_PARALLELISM = 8
+# Model-side batch, independent of the Qdrant upsert batch_size
+EMBED_BATCH_SIZE = 128
+# Concurrent upsert requests during ingest
+UPLOAD_PARALLELISM = 4
+# Above this many new vectors, indexing is paused during the upserts
+BULK_INDEXING_MIN_POINTS = 5_000
+# Restored after a bulk load when the collection reports no (or a paused, 0) threshold
+DEFAULT_INDEXING_THRESHOLD = 20_000
+# Stored next to "hash": points hashed with anything else get re-embedded
+HASH_ALGO = "blake3"
+# Progress bars only on an interactive terminal; in containers they're just stderr noise
+PROGRESS_DISABLED = not sys.stderr.isatty()
 
 def normalize_text(text: str) -> str:
     if not text: return ""
-    return unicodedata.normalize("NFKC", str(text).strip()[:1000])
+    text = str(text).strip()[:1000]
+    # ASCII is already NFKC: skip the normalization pass for the common case
+    if text.isascii(): return text
+    return unicodedata.normalize("NFKC", text)
+
+def text_hash(text: str) -> str:
+    return blake3.blake3(text.encode("utf-8")).hexdigest()
+
+def dense_vector_size() -> int:
+    """Dense dimension from FastEmbed's model metadata (no probe embedding needed)."""
+    for m in TextEmbedding.list_supported_models():
+        if m["model"].lower() == DENSE_MODEL_NAME.lower():
+            return m["dim"]
+    raise KeyError(f"Unknown dense model: {DENSE_MODEL_NAME}")
+
+def l2_normalize(vectors: np.ndarray) -> np.ndarray:
+    """Unit-length rows, so DOT distance equals cosine without per-comparison normalization."""
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+def parse_coordinates(values: List[Any]) -> np.ndarray:
+    """Float array in one pass; None, garbage and inf become NaN (= missing)."""
+    arr = pd.to_numeric(pd.Series(values, dtype=object), errors="coerce").to_numpy(dtype=np.float64, copy=True)
+    arr[~np.isfinite(arr)] = np.nan
+    return arr
 
 def sanitize_id(event: Dict) -> str:
     raw_id = event.get("id") or event.get("event_id")
     date_str = str(event.get("start_date", "no-date"))
     unique_string = f"{str(raw_id).strip()}_{date_str.strip()}"
-    return str(uuid.uuid5(uuid.NAMESPACE_DNS, unique_string))
+    return str(uuid.uuid5(ID_NAMESPACE, unique_string))
+
+# Unresolvable addresses are retried after 30 days (hits are kept for 180)
+NEGATIVE_GEOCODE_TTL = 30 * 86400
+
+# Nominatim usage policy: max 1 req/sec
+NOMINATIM_LIMITER = RateLimiter(rate=1.0)
+
+# Shared keep-alive client: one TLS handshake for the whole ingest, not one per lookup.
+# Closed by the app lifespan (app/main.py).
+geocode_http_client = httpx.AsyncClient(
+    http2=True,
+    headers={"User-Agent": "remap_ingest_bot_v7/7.0"},
+    timeout=15,
+    limits=httpx.Limits(max_keepalive_connections=5),
+)
+
+GEOCODE_TTL = 15552000  # 180 days
+
+# One connection per worker thread (asyncio.to_thread pool), opened once and reused:
+# no connect/close per lookup. WAL lets these readers run alongside the rare writes.
+_cache_local = threading.local()
+
+def cache_connect() -> sqlite3.Connection:
+    conn = getattr(_cache_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(str(INGEST_CACHE_DB))
+        # WAL is persistent (set in init_cache_db); synchronous is per connection
+        conn.execute("PRAGMA synchronous=NORMAL")
+        _cache_local.conn = conn
+    return conn
+
+def geocode_cache_lookup(geo_hash: str):
+    return cache_connect().execute("SELECT lat, lon FROM nominatim_cache WHERE geo_hash=? AND (expires IS NULL OR expires > ?)",
+                                   (geo_hash, int(time.time()))).fetchone()
+
+def geocode_cache_store(geo_hash: str, venue: str, street: str, city: str, lat: Optional[float], lon: Optional[float], ttl: int):
+    conn = cache_connect()
+    conn.execute("INSERT OR REPLACE INTO nominatim_cache (geo_hash, venue, address, city, lat, lon, expires) VALUES (?,?,?,?,?,?,?)",
+                 (geo_hash, venue, street, city, lat, lon, int(time.time()) + ttl))
+    conn.commit()
 
 async def async_geocode_structured(venue: str, city: str, street: str = "") -> Optional[Dict[str, float]]:
     search_query = street if street else venue
@@ -70,107 +173,258 @@ async def async_geocode_structured(venue: str, city: str, street: str = "") -> O
     geo_key = f"{search_query.lower()}|{city.lower()}"
     geo_hash = hashlib.md5(geo_key.encode()).hexdigest()
     
-    conn = sqlite3.connect(str(INGEST_CACHE_DB))
-    res = conn.execute("SELECT lat, lon FROM nominatim_cache WHERE geo_hash=?", (geo_hash,)).fetchone()
-    conn.close()
+    # SQLite I/O off the event loop
+    res = await asyncio.to_thread(geocode_cache_lookup, geo_hash)
     
-    if res and abs(res[0]) > 0.001:
-        return {"lat": res[0], "lon": res[1]}
+    if res:
+        # NULL coordinates = cached "not found", don't ask Nominatim again until it expires
+        if res[0] is not None and abs(res[0]) > 0.001:
+            return {"lat": res[0], "lon": res[1]}
+        if res[0] is None:
+            return None
 
-    # ATTESA RIGOROSA (Nominatim 1 req/sec)
-    await asyncio.sleep(1.5) 
-    
-    async with httpx.AsyncClient() as h_client:
-        try:
-            headers = {"User-Agent": "remap_ingest_bot_v7/7.0"}
-            params = {"street": search_query, "city": city, "format": "json", "limit": 1}
-            resp = await h_client.get("https://nominatim.openstreetmap.org/search", params=params, headers=headers, timeout=15)
-            
-            if resp.status_code == 429:
-                logger.warning("⚠️ 429 - Nominatim Rate Limit. Attesa 10s...")
-                await asyncio.sleep(10)
-                return None
-
-            data = resp.json()
-            if data:
-                lat, lon = float(data[0]["lat"]), float(data[0]["lon"])
-                conn = sqlite3.connect(str(INGEST_CACHE_DB))
-                conn.execute("INSERT OR REPLACE INTO nominatim_cache (geo_hash, venue, address, city, lat, lon, expires) VALUES (?,?,?,?,?,?,?)",
-                             (geo_hash, venue, street, city, lat, lon, int(time.time()) + 15552000))
-                conn.commit()
-                conn.close()
-                return {"lat": lat, "lon": lon}
-        except Exception as e:
-            logger.error(f"❌ Geocoding error: {e}")
+    try:
+        # Waits only if the previous request was less than 1s ago
+        await NOMINATIM_LIMITER.acquire()
+        params = {"street": search_query, "city": city, "format": "json", "limit": 1}
+        resp = await geocode_http_client.get("https://nominatim.openstreetmap.org/search", params=params)
+        
+        if resp.status_code == 429:
+            retry_after = resp.headers.get("Retry-After", "")
+            backoff = int(retry_after) if retry_after.isdigit() else 10
+            logger.warning(f"⚠️ 429 - Nominatim Rate Limit. Pausa globale {backoff}s...")
+            NOMINATIM_LIMITER.penalize(backoff)
+            return None
+
+        data = orjson.loads(resp.content)
+        if data:
+            lat, lon = float(data[0]["lat"]), float(data[0]["lon"])
+            await asyncio.to_thread(geocode_cache_store, geo_hash, venue, street, city, lat, lon, GEOCODE_TTL)
+            return {"lat": lat, "lon": lon}
+
+        if resp.status_code == 200:
+            await asyncio.to_thread(geocode_cache_store, geo_hash, venue, street, city, None, None, NEGATIVE_GEOCODE_TTL)
+    except Exception as e:
+        logger.error(f"❌ Geocoding error: {e}")
     return None
 
-async def ingest_events_into_qdrant(events: List[Dict[str, Any]], batch_size: int = 25):
+async def fetch_existing_hashes(point_ids: List[str]) -> Dict[str, str]:
+    """Map point ID -> stored text hash for the given IDs that already exist (bulk retrieve)."""
+    # Chunks are independent: issue them concurrently (bounded, a 200k-event initial load
+    # would otherwise fire ~200 requests at once) instead of one round-trip after another
+    retrieve_slots = asyncio.Semaphore(RETRIEVE_PARALLELISM)
+
+    async def retrieve_chunk(start: int):
+        async with retrieve_slots:
+            return await client.retrieve(
+                collection_name=COLLECTION_NAME,
+                ids=point_ids[start : start + RETRIEVE_CHUNK_SIZE],
+                with_payload=["hash", "hash_algo"],
+                with_vectors=False,
+            )
+
+    chunks = await asyncio.gather(*(retrieve_chunk(start) for start in range(0, len(point_ids), RETRIEVE_CHUNK_SIZE)))
+    existing = {}
+    for points in chunks:
+        for p in points:
+            payload = p.payload or {}
+            existing[str(p.id)] = payload.get("hash", "") if payload.get("hash_algo") == HASH_ALGO else ""
+    return existing
+
+async def ingest_events_into_qdrant(events: List[Dict[str, Any]], batch_size: int = 256):
     if not events: return {"inserted": 0, "updated": 0, "deleted": 0}
 
-    if not client.collection_exists(COLLECTION_NAME):
-        client.create_collection(
+    global collection_ready
+    if not collection_ready and not await client.collection_exists(COLLECTION_NAME):
+        await client.create_collection(
             collection_name=COLLECTION_NAME,
-            vectors_config={DENSE_VECTOR_NAME: models.VectorParams(size=384, distance=models.Distance.COSINE)},
-            sparse_vectors_config={SPARSE_VECTOR_NAME: models.SparseVectorParams(index=models.SparseIndexParams(on_disk=True))}
+            # Vectors are L2-normalized before upload (and at query time): DOT == COSINE, minus the normalization
+            vectors_config={DENSE_VECTOR_NAME: models.VectorParams(
+                size=dense_vector_size(), distance=models.Distance.DOT, on_disk=True, datatype=models.Datatype.FLOAT16
+            )},
+            sparse_vectors_config={SPARSE_VECTOR_NAME: models.SparseVectorParams(index=models.SparseIndexParams(on_disk=True))},
+            # Product-quantized codes in RAM (~16x smaller than float32), originals on disk
+            # for rescoring (see query_events_hybrid)
+            quantization_config=models.ProductQuantization(
+                product=models.ProductQuantizationConfig(compression=models.CompressionRatio.X16, always_ram=True)
+            ),
         )
+    if not collection_ready:
+        # Filtered fields (get_event by id, geo polygon, date intersection): create only missing indexes
+        info = await client.get_collection(COLLECTION_NAME)
+        existing_fields = set((info.payload_schema or {}).keys())
+        for field_name, field_schema in PAYLOAD_INDEXES.items():
+            if field_name not in existing_fields:
+                await client.create_payload_index(COLLECTION_NAME, field_name, field_schema, wait=False)
+    collection_ready = True
+
+    # Removed events are deleted, not upserted: a delta only knows one occurrence of a
+    # multi-date event, so all its points are matched by the (indexed) payload id
+    removed_ids = list(dict.fromkeys(str(e["id"]) for e in events if e.get("delta_type") == "removed"))
+    events = [e for e in events if e.get("delta_type") != "removed"]
+
+    # Point IDs are deterministic, so existence is a bulk lookup by ID (no payload filter)
+    point_ids = [sanitize_id(e) for e in events]
+    existing_hashes = await fetch_existing_hashes(point_ids)
 
     processed_events = []
-    for e in events:
+    for q_id, e in zip(point_ids, events):
         l_date = e.get("start_localdate") or (str(e["start_date"])[:10] if e.get("start_date") else None)
         l_time = e.get("start_localtime") or e.get("local_time")
         
-        # --- CRUCIALE: CONVERSIONE FLOAT ---
-        loc = e.get("location", {}).copy()
-        try:
-            lat = float(loc.get("lat") or 0.0)
-            lon = float(loc.get("lon") or 0.0)
-        except:
-            lat, lon = 0.0, 0.0
-
-        e["location"]["lat"] = lat
-        e["location"]["lon"] = lon
         e["start_localtime"] = l_time
         e["start_localdate"] = l_date
-        processed_events.append((sanitize_id(e), e))
+        processed_events.append((q_id, e))
 
-    logger.info(f"🌍 Analisi di {len(processed_events)} eventi...")
-    for qid, ev in tqdm(processed_events, desc="Geocoding"):
-        loc = ev.get("location", {})
-        
-        # SKIP se lat/lon sono già validi (> 0.001)
-        if abs(loc.get("lat", 0.0)) > 0.001 and abs(loc.get("lon", 0.0)) > 0.001:
-            continue
-        
+    # --- CRUCIALE: CONVERSIONE FLOAT --- (vectorized; unparsable/non-finite values -> NaN)
+    locs = [ev.setdefault("location", {}) for _, ev in processed_events]
+    lats = parse_coordinates([l.get("lat") for l in locs])
+    lons = parse_coordinates([l.get("lon") for l in locs])
+
+    # SKIP se lat/lon sono già validi: only a missing/out-of-range value or the (0, 0)
+    # placeholder needs a lookup; a real 0.0 on the equator/prime meridian is kept
+    # (NaN fails the range check)
+    null_island = (np.abs(lats) <= 0.001) & (np.abs(lons) <= 0.001)
+    valid = (np.abs(lats) <= 90) & (np.abs(lons) <= 180) & ~null_island
+    to_geocode = np.flatnonzero(~valid).tolist()
+
+    # Missing stays 0.0 in the payload (JSON-safe)
+    for l, lat, lon in zip(locs, np.nan_to_num(lats).tolist(), np.nan_to_num(lons).tolist()):
+        l["lat"] = lat
+        l["lon"] = lon
+
+    logger.info(f"🌍 Analisi di {len(processed_events)} eventi, {len(to_geocode)} da geocodificare...")
+    # One lookup per distinct address: recurring venues (weekly events, multi-date shows)
+    # would otherwise repeat the same query, and a 429/error would not be cached
+    address_groups: Dict[Tuple[str, str, str], List[Dict]] = {}
+    for i in to_geocode:
+        ev = processed_events[i][1]
+        loc = ev["location"]
         venue, city = loc.get("venue", ""), ev.get("city", "")
         street = loc.get("address", "").split(",")[0] if loc.get("address") else ""
         
         if (street or venue) and city:
-            coords = await async_geocode_structured(venue, city, street)
-            if coords:
-                ev["location"].update(coords)
+            address_groups.setdefault((venue, city, street), []).append(loc)
+
+    async def geocode_group(venue: str, city: str, street: str, group_locs: List[Dict]) -> bool:
+        coords = await async_geocode_structured(venue, city, street)
+        if coords:
+            for loc in group_locs:
+                loc.update(coords)
+        return coords is not None
+
+    # Concurrent: cache hits finish immediately, misses overlap their network latency
+    # while NOMINATIM_LIMITER keeps request starts at 1/s
+    resolved = await tqdm_asyncio.gather(
+        *(geocode_group(venue, city, street, group_locs) for (venue, city, street), group_locs in address_groups.items()),
+        desc="Geocoding",
+        disable=PROGRESS_DISABLED,
+    )
+    if address_groups:
+        logger.info(f"📍 Geocodificati {sum(resolved)}/{len(address_groups)} indirizzi")
+
+    # Hash the indexed text up front so the embed/skip decision is made before any model call
+    # Single pass; a thread pool doesn't pay off here: NFKC holds the GIL and the texts are
+    # short (<= 1000 chars), so hashing them is cheaper than dispatching them to workers
+    all_texts, all_hashes = [], []
+    for _, ev in processed_events:
+        text = normalize_text(f"{ev.get('title','')} {ev.get('description','')} {ev.get('city','')}")
+        all_texts.append(text)
+        all_hashes.append(text_hash(text))
+    needs_embedding = [existing_hashes.get(q_id) != h for (q_id, _), h in zip(processed_events, all_hashes)]
+
+    # One model call per run over all changed texts: wider ONNX batches than the upsert batches
+    embed_idx = [i for i, needed in enumerate(needs_embedding) if needed]
+    # Occurrences of the same event (one point per date) share their text: embed it once
+    embed_texts = list(dict.fromkeys(all_texts[i] for i in embed_idx))
+    logger.info(f"🧠 {len(embed_idx)}/{len(processed_events)} eventi da embeddare ({len(embed_texts)} testi distinti)")
+    # Worker threads: the ONNX forward passes would otherwise stall the event loop
+    dense_embs, sparse_embs = [], []
+    if embed_texts:
+        dense_embs, sparse_embs = await asyncio.gather(
+            asyncio.to_thread(lambda: list(get_dense_model().passage_embed(embed_texts, batch_size=EMBED_BATCH_SIZE))),
+            asyncio.to_thread(lambda: list(get_sparse_model().passage_embed(embed_texts, batch_size=EMBED_BATCH_SIZE))),
+        )
+        dense_embs = l2_normalize(np.stack(dense_embs))
+    text_pos = {text: pos for pos, text in enumerate(embed_texts)}
+    emb_pos = {i: text_pos[all_texts[i]] for i in embed_idx}
+
+    updated = sum(q_id in existing_hashes for q_id, _ in processed_events)
+    inserted = len(processed_events) - updated
+    batch_starts = range(0, len(processed_events), batch_size)
+    # Bulk loads: build the HNSW graph once at the end instead of per batch.
+    # Until the optimizer finishes, new points are still searchable (brute force).
+    bulk = len(embed_idx) >= BULK_INDEXING_MIN_POINTS
+    if bulk:
+        # Put back whatever the collection was configured with, not a hard-coded value
+        collection_info = await client.get_collection(COLLECTION_NAME)
+        indexing_threshold = collection_info.config.optimizer_config.indexing_threshold
+        # 0 = left paused by a run that died before its finally: don't restore "never index"
+        if not indexing_threshold:
+            indexing_threshold = DEFAULT_INDEXING_THRESHOLD
+        await client.update_collection(COLLECTION_NAME, optimizer_config=models.OptimizersConfigDiff(indexing_threshold=0))
 
-    inserted = 0
-    for start in tqdm(range(0, len(processed_events), batch_size), desc="Qdrant Upsert"):
+    def build_batch(start: int):
         batch = processed_events[start : start + batch_size]
-        batch_texts = [normalize_text(f"{ev.get('title','')} {ev.get('description','')} {ev.get('city','')}") for _, ev in batch]
-        
-        dense_embs = list(dense_embedding_model.passage_embed(batch_texts))
-        sparse_embs = list(sparse_embedding_model.passage_embed(batch_texts))
-
-        points = []
-        for idx, (q_id, event) in enumerate(batch):
-            inserted += 1
-            points.append(models.PointStruct(
-                id=q_id,
-                vector={
-                    DENSE_VECTOR_NAME: dense_embs[idx].tolist(),
-                    SPARSE_VECTOR_NAME: models.SparseVector(
-                        indices=list(sparse_embs[idx].indices),
-                        values=[float(v) for v in sparse_embs[idx].values]
-                    ),
-                },
-                payload=event,
+
+        # Columnar batch (ids / vectors / payloads): one tolist() for the dense block
+        # instead of a PointStruct + list per point
+        embed_rows, batch_ids, batch_payloads, batch_sparse = [], [], [], []
+        payload_ops = []
+        for i, (q_id, event) in enumerate(batch, start=start):
+            event["hash"] = all_hashes[i]
+            event["hash_algo"] = HASH_ALGO
+            if i not in emb_pos:
+                payload_ops.append(models.OverwritePayloadOperation(
+                    overwrite_payload=models.SetPayload(payload=event, points=[q_id])
+                ))
+                continue
+            idx = emb_pos[i]
+            embed_rows.append(idx)
+            batch_ids.append(q_id)
+            batch_payloads.append(event)
+            batch_sparse.append(models.SparseVector(
+                indices=sparse_embs[idx].indices.tolist(),
+                values=sparse_embs[idx].values.tolist()
             ))
-        client.upsert(collection_name=COLLECTION_NAME, points=points)
+        points = None
+        if batch_ids:
+            points = models.Batch(
+                ids=batch_ids,
+                vectors={
+                    DENSE_VECTOR_NAME: dense_embs[embed_rows].tolist(),
+                    SPARSE_VECTOR_NAME: batch_sparse,
+                },
+                payloads=batch_payloads,
+            )
+        return points, payload_ops
+
+    async def send_batch(start: int, wait: bool):
+        async with upload_slots:
+            # Built only once a slot is free: at most UPLOAD_PARALLELISM batches exist as
+            # Python lists at a time, not the whole ingest
+            points, payload_ops = build_batch(start)
+            if points is not None:
+                await client.upsert(collection_name=COLLECTION_NAME, points=points, wait=wait)
+            if payload_ops:
+                await client.batch_update_points(collection_name=COLLECTION_NAME, update_operations=payload_ops, wait=wait)
+
+    try:
+        # Up to UPLOAD_PARALLELISM batches in flight (wait=False); the last one is sent
+        # with wait=True only after all others were accepted, so it acts as the barrier
+        upload_slots = asyncio.Semaphore(UPLOAD_PARALLELISM)
+        await tqdm_asyncio.gather(*(send_batch(start, False) for start in batch_starts[:-1]), desc="Qdrant Upsert", disable=PROGRESS_DISABLED)
+        if batch_starts:
+            await send_batch(batch_starts[-1], True)
+    finally:
+        if bulk:
+            await client.update_collection(COLLECTION_NAME, optimizer_config=models.OptimizersConfigDiff(indexing_threshold=indexing_threshold))
+
+    deleted = 0
+    if removed_ids:
+        removed_filter = models.Filter(must=[models.FieldCondition(key="id", match=models.MatchAny(any=removed_ids))])
+        deleted = (await client.count(COLLECTION_NAME, count_filter=removed_filter, exact=True)).count
+        if deleted:
+            await client.delete(collection_name=COLLECTION_NAME, points_selector=models.FilterSelector(filter=removed_filter))
 
-    return {"inserted": inserted, "updated": 0, "deleted": 0}
\ No newline at end of file
+    return {"inserted": inserted, "updated": updated, "deleted": deleted}
\ No newline at end of file
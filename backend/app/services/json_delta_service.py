@@ -1,5 +1,5 @@
-import json
-import hashlib
+import orjson
+import blake3
 from pathlib import Path
 from typing import List, Dict, Any
 
@@ -9,8 +9,78 @@ def generate_content_hash(event: Dict) -> str:
     Matches the logic in ingest_service to ensure consistency.
     """
     # We hash the parts that matter. If these change, the event is 'changed'.
-    content = f"{event.get('title','')}{event.get('description','')}{event.get('start_date','')}{event.get('end_date','')}"
-    return hashlib.sha256(content.encode()).hexdigest()
+    # Non-cryptographic use (equality only): BLAKE3 is much faster than SHA-256 here.
+    # Fields are fed one by one (same byte stream as their concatenation, so digests are
+    # unchanged) instead of building a throwaway joined string first.
+    hasher = blake3.blake3()
+    for field in ('title', 'description', 'start_date', 'end_date'):
+        hasher.update(str(event.get(field, '')).encode())
+    return hasher.hexdigest()
+
+HASH_CACHE_DIRNAME = ".hash_cache"
+# Sidecars kept per source (current + last, plus one spare)
+HASH_CACHE_KEEP = 3
+# Bumped when the index entries change shape/meaning (older sidecars are then rebuilt)
+HASH_CACHE_FORMAT = "v2"
+
+def _source_name(file_path: Path) -> str:
+    """'tm_std_it_current' / 'tm_std_it_last' -> 'tm_std_it': both snapshots of a feed share one bucket."""
+    stem = file_path.stem
+    for suffix in ("_current", "_last"):
+        if stem.endswith(suffix):
+            return stem[: -len(suffix)]
+    return stem
+
+def _index_path(file_path: Path, raw: bytes) -> Path:
+    return file_path.parent / HASH_CACHE_DIRNAME / f"{_source_name(file_path)}.{blake3.blake3(raw).hexdigest()}.{HASH_CACHE_FORMAT}.idx.json"
+
+def _build_index(events: List[Dict]) -> Dict[str, List[Any]]:
+    # Last occurrence wins, as in the ID maps below. start_date is kept exactly as
+    # sanitize_id formats it (a missing key becomes "no-date"): ingest rebuilds the
+    # point ID from (id, start_date) when deleting removed events.
+    return {str(e['id']): [generate_content_hash(e), str(e.get('start_date', 'no-date'))] for e in events}
+
+def _save_index(index_path: Path, index: Dict[str, List[Any]]) -> None:
+    index_path.parent.mkdir(exist_ok=True)
+    index_path.write_bytes(orjson.dumps(index))
+    # Only the latest few snapshots of this source can ever be compared again
+    # (pruned per source: feeds share the directory and run at different times)
+    source = index_path.name.split(".", 1)[0]
+    for old in sorted(index_path.parent.glob(f"{source}.*.idx.json"), key=lambda p: p.stat().st_mtime)[:-HASH_CACHE_KEEP]:
+        old.unlink(missing_ok=True)
+
+def load_snapshot_index(file_path: Path) -> Dict[str, List[Any]]:
+    """
+    {id: [content_hash, start_date]} for a snapshot. The index is kept in a sidecar keyed
+    by the file's digest, so yesterday's 'current' file is neither parsed nor re-hashed
+    today as the 'last' one (rotation is a copy, so mtime/path can't be the key).
+    """
+    raw = file_path.read_bytes()
+    index_path = _index_path(file_path, raw)
+    if index_path.exists():
+        try:
+            return orjson.loads(index_path.read_bytes())
+        except orjson.JSONDecodeError:
+            pass
+    index = _build_index(orjson.loads(raw).get("events", []))
+    _save_index(index_path, index)
+    return index
+
+def load_events_and_index(file_path: Path):
+    """Parses a snapshot and returns (events, index), writing the sidecar for the next run."""
+    raw = file_path.read_bytes()
+    events = orjson.loads(raw).get("events", [])
+    index_path = _index_path(file_path, raw)
+    index = None
+    if index_path.exists():
+        try:
+            index = orjson.loads(index_path.read_bytes())
+        except orjson.JSONDecodeError:
+            index = None
+    if index is None:
+        index = _build_index(events)
+        _save_index(index_path, index)
+    return events, index
 
 def compute_json_delta(old_file: Path, new_file: Path) -> List[Dict[str, Any]]:
     """
@@ -19,42 +89,36 @@ def compute_json_delta(old_file: Path, new_file: Path) -> List[Dict[str, Any]]:
     """
     if not old_file.exists():
         # If no old file, every event in new_file is 'added'
-        with open(new_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            events = data.get("events", [])
-            for e in events:
-                e["delta_type"] = "added"
-            return events
-
-    with open(old_file, 'r', encoding='utf-8') as f:
-        old_data = json.load(f)
-    with open(new_file, 'r', encoding='utf-8') as f:
-        new_data = json.load(f)
+        # (index still written: this file is tomorrow's old_file)
+        events, _ = load_events_and_index(new_file)
+        for e in events:
+            e["delta_type"] = "added"
+        return events
 
-    old_events = old_data.get("events", [])
-    new_events = new_data.get("events", [])
+    # The old snapshot is only needed as {id: [hash, start_date]}: no full parse on warm runs
+    old_index = load_snapshot_index(old_file)
+    new_events, new_index = load_events_and_index(new_file)
 
     # Map by Master ID
-    old_map = {e['id']: e for e in old_events}
     new_map = {e['id']: e for e in new_events}
 
     delta_results = []
 
     # 1. Detect Added and Changed
     for eid, new_ev in new_map.items():
-        if eid not in old_map:
+        old_entry = old_index.get(str(eid))
+        if old_entry is None:
             new_ev["delta_type"] = "added"
             delta_results.append(new_ev)
         else:
             # Content check via hash
-            if generate_content_hash(new_ev) != generate_content_hash(old_map[eid]):
+            if new_index[str(eid)][0] != old_entry[0]:
                 new_ev["delta_type"] = "changed"
                 delta_results.append(new_ev)
 
-    # 2. Detect Removed
-    for eid, old_ev in old_map.items():
-        if eid not in new_map:
-            old_ev["delta_type"] = "removed"
-            delta_results.append(old_ev)
+    # 2. Detect Removed (ID + start_date is all the ingest needs to delete the point)
+    for eid, (_, start_date) in old_index.items():
+        if eid not in new_index:
+            delta_results.append({"id": eid, "start_date": start_date, "delta_type": "removed"})
 
-    return delta_results
\ No newline at end of file
+    return delta_results
@@ -1,16 +1,20 @@
 import openrouteservice
 import requests
 import sqlite3
-import hashlib
+import struct
+import blake3
 import time
+import threading
 import logging
 import os
-import json
+import orjson
 from pathlib import Path
 from app.core.config import OPENROUTE_API_KEY, OPENROUTE_BASE_URL
 from app.core import config
 from typing import Tuple, Dict, Any, List, Optional
 from contextlib import contextmanager
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FuturesTimeout, as_completed
+from collections import OrderedDict
 import atexit
 
 logger = logging.getLogger(__name__)
@@ -32,21 +36,44 @@ else:
 CACHE_DB = DATASET_DIR / "cache.db"
 DATASET_DIR.mkdir(parents=True, exist_ok=True)
 
+def _configure(conn: sqlite3.Connection) -> sqlite3.Connection:
+    """Per-connection PRAGMAs (only journal_mode persists in the file)"""
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA busy_timeout=5000")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA cache_size=-20000")  # ~20 MB
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA mmap_size=268435456")
+    return conn
+
+def _key_is_text(conn: sqlite3.Connection, table: str, key_col: str) -> bool:
+    return any(col[1] == key_col and col[2].upper() == "TEXT" for col in conn.execute(f"PRAGMA table_info({table})"))
+
 def init_db():
     """Production DB setup"""
-    conn = sqlite3.connect(CACHE_DB, check_same_thread=False)
+    conn = _configure(sqlite3.connect(CACHE_DB, check_same_thread=False))
     try:
-        conn.execute("PRAGMA journal_mode=WAL")
-        conn.execute("PRAGMA synchronous=NORMAL")
-        conn.execute("PRAGMA cache_size=10000")
         conn.execute("PRAGMA wal_autocheckpoint=100")
-        conn.execute("PRAGMA temp_store=MEMORY")
         conn.execute("PRAGMA optimize")
+
+        # Schema changes under one write lock: backends sharing cache.db may start together
+        conn.execute("BEGIN IMMEDIATE")
+
+        # Old caches keyed by hex TEXT (old key hash, so no row could be hit again):
+        # dropped and recreated with 16-byte BLOB keys (half the PK index size).
+        # *_text are leftovers of an earlier rename-and-copy migration.
+        legacy = [t for t, k in (("geocode_cache", "address_hash"), ("route_cache", "route_hash")) if _key_is_text(conn, t, k)]
+        for table in ("geocode_cache", "route_cache"):
+            conn.execute(f"DROP TABLE IF EXISTS {table}_text")
+        for table in legacy:
+            conn.execute(f"DROP TABLE IF EXISTS {table}")
+        if legacy:
+            logger.info(f"🔑 Legacy TEXT-key caches dropped: {legacy}")
         
         # GEOCODE CACHE
         conn.execute("""
             CREATE TABLE IF NOT EXISTS geocode_cache (
-                address_hash TEXT PRIMARY KEY,
+                address_hash BLOB PRIMARY KEY,
                 address TEXT NOT NULL,
                 lon REAL NOT NULL,
                 lat REAL NOT NULL,
@@ -58,7 +85,7 @@ def init_db():
         # ROUTE CACHE
         conn.execute("""
             CREATE TABLE IF NOT EXISTS route_cache (
-                route_hash TEXT PRIMARY KEY,
+                route_hash BLOB PRIMARY KEY,
                 start_lon REAL NOT NULL,
                 start_lat REAL NOT NULL,
                 end_lon REAL NOT NULL,
@@ -81,47 +108,97 @@ init_db()
 
 CACHE_TTL = 90 * 86400
 MAX_CACHE_SIZE = 20000
+# Expired rows are already filtered by every SELECT, so the COUNT/DELETE pass
+# only runs once per this many inserts into a table (not on every cache miss)
+CLEANUP_EVERY_INSERTS = 500
+
+# One connection per thread, kept open: route handlers and asyncio.to_thread workers
+# are pooled threads, so this avoids reopening cache.db (+ -wal/-shm) on every lookup
+_db_local = threading.local()
+_db_conns: List[sqlite3.Connection] = []
+
+def _thread_connection() -> sqlite3.Connection:
+    conn = getattr(_db_local, "conn", None)
+    if conn is None:
+        conn = _configure(sqlite3.connect(CACHE_DB, check_same_thread=False))
+        _db_local.conn = conn
+        _db_conns.append(conn)
+    return conn
 
 @contextmanager
 def get_db_connection():
-    """Thread-safe DB connection"""
-    conn = sqlite3.connect(CACHE_DB, timeout=30.0, check_same_thread=False)
+    """Thread-safe DB connection (reused per thread)"""
+    conn = _thread_connection()
     try:
         yield conn
         conn.commit()
     except Exception:
         conn.rollback()
         raise
-    finally:
-        conn.close()
+
+class MemoryCache:
+    """Thread-safe in-process LRU with per-entry expiry, in front of cache.db"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: bytes):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires <= time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key: bytes, value: Any, expires: int):
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+# Hot addresses/routes skip SQLite (and route JSON parsing) entirely.
+# Routes are returned as shared dicts: callers only read them.
+_geo_mem = MemoryCache(maxsize=4096)
+_route_mem = MemoryCache(maxsize=2048)
+
+# Cleanup SQL per table, formatted once: each call reuses the same statement strings
+# (and so sqlite3's statement cache) instead of rebuilding them with f-strings
+_CLEANUP_SQL = {
+    table: (
+        f"DELETE FROM {table} WHERE expires <= ?",
+        # Size cap: once at MAX_CACHE_SIZE, drop the oldest down to half. The count is
+        # taken inside the statement (only live rows remain after the expiry delete).
+        # Every row gets expires = write time + CACHE_TTL, so expires order is write order
+        # and the eviction walks the expires index instead of sorting by created
+        f"""
+        DELETE FROM {table} WHERE {hash_col} IN (
+            SELECT {hash_col} FROM {table}
+            ORDER BY expires ASC
+            LIMIT (SELECT CASE WHEN COUNT(*) >= ? THEN COUNT(*) - ? ELSE 0 END FROM {table})
+        )
+        """,
+    )
+    for table, hash_col in (("geocode_cache", "address_hash"), ("route_cache", "route_hash"))
+}
 
 def cleanup_cache(table: str):
-    """Atomic cleanup"""
-    now = int(time.time())
+    """Atomic cleanup: one write transaction, two statements"""
+    delete_expired, evict_oldest = _CLEANUP_SQL[table]
     with get_db_connection() as conn:
-        expired = conn.execute(
-            f"DELETE FROM {table} WHERE expires <= ?", (now,)
-        ).rowcount
-        
-        size = conn.execute(
-            f"SELECT COUNT(*) FROM {table} WHERE expires > ?", (now,)
-        ).fetchone()[0]
+        # Take the write lock up front; both deletes see the same snapshot
+        conn.execute("BEGIN IMMEDIATE")
+        expired = conn.execute(delete_expired, (int(time.time()),)).rowcount
+        evicted = conn.execute(evict_oldest, (MAX_CACHE_SIZE, MAX_CACHE_SIZE // 2)).rowcount
         
-        if size >= MAX_CACHE_SIZE:
-            excess = max(0, size - MAX_CACHE_SIZE // 2)
-            # Use appropriate hash column based on table
-            hash_col = "address_hash" if table == "geocode_cache" else "route_hash"
-            conn.execute(
-                f"""
-                DELETE FROM {table} WHERE {hash_col} IN (
-                    SELECT {hash_col} FROM {table} 
-                    WHERE expires > ? 
-                    ORDER BY created ASC 
-                    LIMIT ?
-                )
-                """, (now, excess)
-            )
-            logger.info(f"🧹 {table} resized: active={size}")
+        if evicted > 0:
+            logger.info(f"🧹 {table} resized: evicted={evicted}")
         elif expired > 0:
             logger.debug(f"🧹 {table}: expired={expired}")
 
@@ -147,52 +224,136 @@ def photon_geocode(address: str) -> Optional[Tuple[float, float]]:
         logger.debug(f"Photon failed: {e}")
         return None
 
+def ors_geocode(address: str) -> Optional[Tuple[float, float]]:
+    """ORS (Pelias) geocoding; raises on API errors"""
+    result = ors_client.pelias_search(text=address)
+    if result and result.get('features'):
+        coords = result['features'][0]['geometry']['coordinates']
+        return coords[0], coords[1]
+    return None
+
+# Hedged lookup: Photon gets a head start; if it is slow (or finds nothing) ORS runs
+# alongside and the first hit wins, so a slow Photon costs max(), not sum(), of both.
+# ORS is not fired unconditionally: its geocoding quota is metered.
+PHOTON_HEDGE_DELAY = 1.5
+_geocode_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="geocode")
+
+def race_geocoders(address: str) -> Tuple[Tuple[float, float], str]:
+    """Returns ((lon, lat), source); raises ValueError if neither backend finds the address"""
+    photon = _geocode_pool.submit(photon_geocode, address)
+    try:
+        res = photon.result(timeout=PHOTON_HEDGE_DELAY)
+        if res:
+            return res, "Photon"
+        pending = set()
+    except FuturesTimeout:
+        pending = {photon}
+    pending.add(_geocode_pool.submit(ors_geocode, address))
+
+    error = None
+    for future in as_completed(pending):
+        try:
+            res = future.result()
+        except Exception as e:
+            error = e
+            continue
+        if res:
+            return res, "Photon" if future is photon else "ORS"
+    raise ValueError(f"Geocoding failed: {error or 'No geocoding results'}")
+
+# Hot-path statements: the same SQL string on a long-lived connection is parsed
+# once and then served from sqlite3's per-connection statement cache
+_SELECT_GEO = "SELECT lon, lat, expires FROM geocode_cache WHERE address_hash=? AND expires > ?"
+_UPSERT_GEO = """
+    INSERT INTO geocode_cache (address_hash, address, lon, lat, expires)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(address_hash) DO UPDATE SET
+        lon=excluded.lon, lat=excluded.lat, expires=excluded.expires, created=excluded.created
+"""
+_SELECT_ROUTE = "SELECT route_json, expires FROM route_cache WHERE route_hash=? AND expires > ?"
+_UPSERT_ROUTE = """
+    INSERT INTO route_cache (route_hash, start_lon, start_lat, end_lon, end_lat, profile, route_json, expires)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(route_hash) DO UPDATE SET
+        route_json=excluded.route_json, expires=excluded.expires, created=excluded.created
+"""
+
+_inserts_since_cleanup = {"geocode_cache": 0, "route_cache": 0}
+_inserts_lock = threading.Lock()
+
+def note_insert(table: str):
+    """Count an insert; run cleanup_cache(table) every CLEANUP_EVERY_INSERTS"""
+    with _inserts_lock:
+        _inserts_since_cleanup[table] += 1
+        if _inserts_since_cleanup[table] < CLEANUP_EVERY_INSERTS:
+            return
+        _inserts_since_cleanup[table] = 0
+    cleanup_cache(table)
+
+# Once per process start as well, so short-lived workers still trim the tables
+for _table in _inserts_since_cleanup:
+    cleanup_cache(_table)
+
+# Singleflight: concurrent misses for the same key (two users, same address/route)
+# wait for the one lookup already running instead of each calling Photon/ORS.
+# Keys are the 16-byte cache hashes; geocode and route hashes never collide in practice.
+_inflight: Dict[bytes, Future] = {}
+_inflight_lock = threading.Lock()
+
+def singleflight(key: bytes, fn, *args):
+    with _inflight_lock:
+        future = _inflight.get(key)
+        leader = future is None
+        if leader:
+            future = _inflight[key] = Future()
+    if not leader:
+        return future.result()
+    try:
+        result = fn(*args)
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    else:
+        future.set_result(result)
+        return result
+    finally:
+        with _inflight_lock:
+            del _inflight[key]
+
 def geocode_address(address: str) -> Tuple[float, float]:
     """Photon → ORS fallback - FULLY CACHED"""
     if len(address := address.strip()) < 3:
         raise ValueError("Address too short")
     
-    addr_hash = hashlib.md5(address.lower().encode()).hexdigest()
+    # Cache key only: non-cryptographic speed is enough; raw 16-byte digest (BLOB key)
+    addr_hash = blake3.blake3(address.lower().encode()).digest(length=16)
+    if (cached := _geo_mem.get(addr_hash)) is not None:
+        return cached
+    return singleflight(addr_hash, _geocode_from_db_or_api, address, addr_hash)
+
+def _geocode_from_db_or_api(address: str, addr_hash: bytes) -> Tuple[float, float]:
     now = int(time.time())
     
     with get_db_connection() as conn:
-        result = conn.execute(
-            "SELECT lon, lat FROM geocode_cache WHERE address_hash=? AND expires > ?",
-            (addr_hash, now)
-        ).fetchone()
+        result = conn.execute(_SELECT_GEO, (addr_hash, now)).fetchone()
         
         if result:
+            _geo_mem.put(addr_hash, (result[0], result[1]), result[2])
             return result[0], result[1]
     
-    cleanup_cache("geocode_cache")
-    
-    # 1. Photon
-    res = photon_geocode(address)
-    lon, lat = res if res else (None, None)
-    source = "Photon" if lon else "Empty"
-    
-    # 2. ORS fallback
-    if lon is None:
-        try:
-            result = ors_client.pelias_search(text=address)
-            if result and result.get('features'):
-                coords = result['features'][0]['geometry']['coordinates']
-                lon, lat = coords[0], coords[1]
-                source = "ORS"
-            else:
-                raise ValueError("No geocoding results")
-        except Exception as e:
-            logger.error(f"❌ Geocoding failed: {e}")
-            raise ValueError(f"Geocoding failed: {e}")
+    # Photon → ORS (hedged)
+    try:
+        (lon, lat), source = race_geocoders(address)
+    except ValueError as e:
+        logger.error(f"❌ {e}")
+        raise
     
     # Cache success
     with get_db_connection() as conn:
-        conn.execute("""
-            INSERT OR REPLACE INTO geocode_cache 
-            (address_hash, address, lon, lat, expires) 
-            VALUES (?, ?, ?, ?, ?)
-        """, (addr_hash, address, lon, lat, now + CACHE_TTL))
+        conn.execute(_UPSERT_GEO, (addr_hash, address, lon, lat, now + CACHE_TTL))
     
+    _geo_mem.put(addr_hash, (lon, lat), now + CACHE_TTL)
+    note_insert("geocode_cache")
     logger.info(f"✅ GEO CACHED ({source}): ({lon:.6f}, {lat:.6f})")
     return lon, lat
 
@@ -204,22 +365,28 @@ def get_route(coords: List[List[float]], profile: str = 'driving-car',
     
     if len(coords) != 2:
         raise ValueError("Exactly 2 coordinates [[lon,lat],[lon,lat]] required for route")
+    if len(radiuses) != 2:
+        raise ValueError("Exactly 2 radiuses (one per coordinate) required for route")
     
-    coords_key = json.dumps(coords, separators=(',', ':'))
-    radiuses_key = json.dumps(radiuses, separators=(',', ':'))
-    route_hash = hashlib.md5(f"{coords_key}:{profile}:{radiuses_key}".encode()).hexdigest()
+    # Fixed-layout key: 6 little-endian doubles + profile, no JSON encoding
+    key = struct.pack("<6d", coords[0][0], coords[0][1], coords[1][0], coords[1][1], radiuses[0], radiuses[1])
+    route_hash = blake3.blake3(key + profile.encode()).digest(length=16)
+    if (cached := _route_mem.get(route_hash)) is not None:
+        return cached
+    return singleflight(route_hash, _route_from_db_or_api, coords, profile, radiuses, route_hash)
+
+def _route_from_db_or_api(coords: List[List[float]], profile: str, radiuses: List[float],
+                          route_hash: bytes) -> Dict[str, Any]:
     now = int(time.time())
     
     with get_db_connection() as conn:
-        result = conn.execute(
-            "SELECT route_json FROM route_cache WHERE route_hash=? AND expires > ?",
-            (route_hash, now)
-        ).fetchone()
+        result = conn.execute(_SELECT_ROUTE, (route_hash, now)).fetchone()
         
         if result:
-            return json.loads(result[0])
-    
-    cleanup_cache("route_cache")
+            # Bytes from orjson; older rows are TEXT, which orjson.loads also accepts
+            route_data = orjson.loads(result[0])
+            _route_mem.put(route_hash, route_data, result[1])
+            return route_data
     
     try:
         # Requesting format='geojson' returns a FeatureCollection
@@ -237,16 +404,14 @@ def get_route(coords: List[List[float]], profile: str = 'driving-car',
             raise ValueError("Invalid GeoJSON route response")
         
         with get_db_connection() as conn:
-            conn.execute("""
-                INSERT OR REPLACE INTO route_cache 
-                (route_hash, start_lon, start_lat, end_lon, end_lat, profile, route_json, expires)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
+            conn.execute(_UPSERT_ROUTE, (
                 route_hash, coords[0][0], coords[0][1],
                 coords[1][0], coords[1][1], profile,
-                json.dumps(route_data), now + CACHE_TTL
+                orjson.dumps(route_data), now + CACHE_TTL
             ))
         
+        _route_mem.put(route_hash, route_data, now + CACHE_TTL)
+        note_insert("route_cache")
         pts_count = len(route_data['features'][0]['geometry']['coordinates'])
         logger.info(f"✅ ROUTE CACHED: {pts_count} pts")
         return route_data
@@ -258,6 +423,8 @@ def get_route(coords: List[List[float]], profile: str = 'driving-car',
 # Cleanup on shutdown
 def cleanup_session():
     _photon_session.close()
+    for conn in _db_conns:
+        conn.close()
 
 atexit.register(cleanup_session)
 
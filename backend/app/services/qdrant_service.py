@@ -1,3 +1,4 @@
+from functools import lru_cache
 from qdrant_client import QdrantClient
 from qdrant_client.http import models as qmodels
 from app.core.config import QDRANT_SERVER, QDRANT_API_KEY, COLLECTION_NAME
@@ -5,18 +6,26 @@ from app.core.config import QDRANT_SERVER, QDRANT_API_KEY, COLLECTION_NAME
 
 qdrant_client = QdrantClient(url=QDRANT_SERVER, api_key=QDRANT_API_KEY, timeout=4000000)
 
-def build_geo_filter(polygon_coords_qdrant):
+# Repeat searches over the same area/dates (common from the map UI) reuse the already
+# validated pydantic models; a buffered route polygon has hundreds of vertices.
+# Callers only combine these filters (build_final_filter), never mutate them.
+@lru_cache(maxsize=256)
+def _cached_geo_filter(points):
     return qmodels.Filter(
         must=[
             qmodels.FieldCondition(
                 key="location",
                 geo_polygon=qmodels.GeoPolygon(
-                    exterior=qmodels.GeoLineString(points=polygon_coords_qdrant)
+                    exterior=qmodels.GeoLineString(points=[{"lon": lon, "lat": lat} for lon, lat in points])
                 )
             )
         ]
     )
 
+def build_geo_filter(polygon_coords_qdrant):
+    return _cached_geo_filter(tuple((p["lon"], p["lat"]) for p in polygon_coords_qdrant))
+
+@lru_cache(maxsize=256)
 def build_date_intersection_filter(start_date, end_date):
     return qmodels.Filter(
         must=[
@@ -40,8 +49,8 @@ def query_events_hybrid(dense_vector, sparse_vector, query_filter, collection_na
         prefetch=[
             qmodels.Prefetch(
                 query=qmodels.SparseVector(
-                    indices=list(sparse_vector.indices),
-                    values=list(sparse_vector.values)
+                    indices=sparse_vector.indices.tolist(),
+                    values=sparse_vector.values.tolist()
                 ),
                 using="sparse_vector",
                 limit=50,
@@ -52,6 +61,10 @@ def query_events_hybrid(dense_vector, sparse_vector, query_filter, collection_na
                 using="dense_vector",
                 limit=50,
                 score_threshold=score_threshold,  # Optional: filter out low-score results
+                # Search on the quantized codes, rescore the top 2x with the original vectors
+                params=qmodels.SearchParams(
+                    quantization=qmodels.QuantizationSearchParams(rescore=True, oversampling=2.0)
+                ),
             ),
         ],
         query=qmodels.FusionQuery(fusion=qmodels.Fusion.RRF),
@@ -62,9 +75,10 @@ def query_events_hybrid(dense_vector, sparse_vector, query_filter, collection_na
     )
 
     # Process results into dataframe
+    # Payloads are freshly deserialized per response: tag them in place, no copy
     records = []
     for point in results.points:
-        entry = dict(point.payload)
+        entry = point.payload
         entry["score"] = point.score
         records.append(entry)
     
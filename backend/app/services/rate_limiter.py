@@ -0,0 +1,28 @@
+import asyncio
+import time
+
+
+class RateLimiter:
+    """Token bucket shared by all tasks: at most `rate` acquisitions per second."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def penalize(self, seconds: float):
+        """Push every waiting/future acquisition back by `seconds` (e.g. after a 429)."""
+        self.tokens -= seconds * self.rate
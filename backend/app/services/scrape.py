@@ -1,19 +1,100 @@
 import httpx
-from bs4 import BeautifulSoup
+from selectolax.lexbor import LexborHTMLParser
 from datetime import datetime, timedelta
 import asyncio
 from typing import List, Optional, Tuple, Dict, Any
-import json
+import orjson
+import numpy as np
 
 # Importazione configurazioni centralizzate
-from app.core.config import UNPLI_SESSION_ID, UNPLI_API_BASE_URL, UNPLI_WEB_BASE_URL
+from app.core.config import UNPLI_SESSION_ID, UNPLI_API_BASE_URL, UNPLI_WEB_BASE_URL, UNPLI_MAX_RPS
+from app.services.rate_limiter import RateLimiter
+
+# Concurrent nextOccurrences requests while transforming a page of events
+DETAILS_CONCURRENCY = 8
+
+# Request budget shared by every UNPLI call (list pages + occurrences, across scrapes):
+# UNPLI_MAX_RPS from config, evenly spaced (no bursts) like the original fixed pause;
+# a 429 pushes it back by the server's Retry-After
+UNPLI_LIMITER = RateLimiter(rate=UNPLI_MAX_RPS)
+
+# Static UNPLI headers live on the client; only DW-SessionID varies per call
+UNPLI_HEADERS = {
+    "DW-Source": "desklineweb",
+    "Accept": "application/json, text/plain, */*",
+    "Referer": "https://www.unpliveneto.it/",
+    "User-Agent": "Mozilla/5.0",
+}
+
+# Static part of the event-list query (only the page changes per call)
+UNPLI_LIST_PARAMS = {
+    "filterId": "",
+    "fields": (
+        "id,name,dbCode,owner,isTopEvent,visibilityLevel,date,hasMoreDates,"
+        "onlineBookable,location{place,town,regions,country,coordinate{name,long,lat}},"
+        "plainDescriptions(len:50){description,type},descriptions(types:[32,33]){description,type},"
+        "dateStartTimes,mainCriteria{id,name,value},criteria{groupId,groupName,items{id,name,value}},"
+        "eventGroups{id,name},holidayThemes{id,name,order},images(count:1,sizes:[55]){id,name,extension,"
+        "copyright,author,license,urls,resolutionX,resolutionY,description},urlFriendlyName,"
+        "startTimeDurations{time,weekDays,duration,},guestCards{id,name,type,hasIcon,iconUrl,webLink}"
+    ),
+    "sortingFields": "date,-topEvent,time",
+    "hashF": 0,
+}
+
+UNPLI_DETAILS_BASE_URL = UNPLI_API_BASE_URL.rstrip('/')
+UNPLI_OCCURRENCES_FIELDS = 'nextOccurrences(fromDate:"{from_date}",count:100){{items{{date,dayOfWeek,startTime,duration}},hasMoreItems}}'
+
+# Shared client: one TLS connection per host, multiplexed over HTTP/2, reused across
+# scrapes (closed in the app lifespan)
+unpli_http_client = httpx.AsyncClient(
+    http2=True,
+    headers=UNPLI_HEADERS,
+    timeout=60.0,
+    limits=httpx.Limits(max_connections=DETAILS_CONCURRENCY * 2, max_keepalive_connections=DETAILS_CONCURRENCY),
+)
+
+def parse_local_datetime(date_part: str, time_part: str) -> datetime:
+    """'YYYY-MM-DD' + 'HH:MM' via the C fromisoformat; strptime only as the lenient fallback."""
+    try:
+        return datetime.fromisoformat(f"{date_part}T{time_part}")
+    except ValueError:
+        return datetime.strptime(f"{date_part} {time_part}", "%Y-%m-%d %H:%M")
 
 def clean_html(raw_html: Optional[str]) -> str:
     """Rimuove i tag HTML e pulisce il testo."""
     if not raw_html:
         return ""
-    soup = BeautifulSoup(raw_html, "html.parser")
-    return soup.get_text(separator=" ", strip=True)
+    # lexbor (C) keeps the tree out of Python; only the final string is materialized.
+    # split/join drops the empty separators left by whitespace-only text nodes
+    root = LexborHTMLParser(raw_html).root
+    return " ".join(root.text(separator=" ", strip=True).split()) if root is not None else ""
+
+def occurrence_end_date(date_part: str, time_part: str, duration_hours) -> str:
+    """Fine occorrenza: inizio + durata, al massimo le 23:59:59 del giorno di inizio."""
+    try:
+        dt_start = parse_local_datetime(date_part, time_part[:5])
+        if duration_hours > 0:
+            dt_end = dt_start + timedelta(hours=duration_hours)
+            if dt_end.date() > dt_start.date():
+                dt_end = dt_start.replace(hour=23, minute=59, second=59)
+        else:
+            dt_end = dt_start.replace(hour=23, minute=59, second=59)
+        return dt_end.isoformat()
+    except:
+        return f"{date_part}T23:59:59"
+
+def occurrence_end_dates(occurrences: List[Tuple[str, str, int]]) -> List[str]:
+    """occurrence_end_date for all of an event's occurrences as one datetime64 pass;
+    per-item path only when some date/time/duration doesn't parse."""
+    try:
+        starts = np.array([f"{d}T{t[:5]}" for d, t, _ in occurrences], dtype="datetime64[s]")
+        hours = np.array([h for _, _, h in occurrences], dtype=float)
+    except (ValueError, TypeError):
+        return [occurrence_end_date(*occurrence) for occurrence in occurrences]
+    day_end = starts.astype("datetime64[D]") + np.timedelta64(86399, "s")
+    ends = starts + (hours * 3600).astype("timedelta64[s]")
+    return np.where((hours > 0) & (ends <= day_end), ends, day_end).astype(str).tolist()
 
 async def fetch_unpli_events(
     session: httpx.AsyncClient,
@@ -23,38 +104,23 @@ async def fetch_unpli_events(
 ) -> Optional[List[Dict[str, Any]]]:
     """Recupera la lista eventi base dall'API UNPLI."""
     url = UNPLI_API_BASE_URL
-    params = {
-        "filterId": "",
-        "fields": (
-            "id,name,dbCode,owner,isTopEvent,visibilityLevel,date,hasMoreDates,"
-            "onlineBookable,location{place,town,regions,country,coordinate{name,long,lat}},"
-            "plainDescriptions(len:50){description,type},descriptions(types:[32,33]){description,type},"
-            "dateStartTimes,mainCriteria{id,name,value},criteria{groupId,groupName,items{id,name,value}},"
-            "eventGroups{id,name},holidayThemes{id,name,order},images(count:1,sizes:[55]){id,name,extension,"
-            "copyright,author,license,urls,resolutionX,resolutionY,description},urlFriendlyName,"
-            "startTimeDurations{time,weekDays,duration,},guestCards{id,name,type,hasIcon,iconUrl,webLink}"
-        ),
-        "sortingFields": "date,-topEvent,time",
-        "pageNo": page_no,
-        "pageSize": page_size,
-        "hashF": 0
-    }
-    headers = {
-        "DW-Source": "desklineweb", 
-        "DW-SessionID": session_id,
-        "Accept": "application/json, text/plain, */*", 
-        "Referer": "https://www.unpliveneto.it/",
-        "User-Agent": "Mozilla/5.0"
-    }
+    params = {**UNPLI_LIST_PARAMS, "pageNo": page_no, "pageSize": page_size}
+    headers = {"DW-SessionID": session_id}
     try:
+        await UNPLI_LIMITER.acquire()
         response = await session.get(url, headers=headers, params=params)
         response.raise_for_status()
-        data = response.json()
+        data = orjson.loads(response.content)
         return data.get("data") or data.get("events")
     except Exception as e:
         print(f"Error fetching events: {e}")
     return None
 
+# Occurrences per (dbCode, event_id, from_date), shared by concurrent and repeated
+# scrapes for a while (in-flight requests are awaited, not repeated)
+DETAILS_CACHE_TTL = 6 * 3600
+_details_cache: Dict[Tuple[str, str, str], asyncio.Future] = {}
+
 async def fetch_event_details_dates(
     session: httpx.AsyncClient,
     dbCode: str,
@@ -63,29 +129,55 @@ async def fetch_event_details_dates(
     from_date: Optional[str] = None,
     max_retries: int = 5
 ) -> List[Tuple[str, str, int]]:
-    """Recupera le occorrenze future per eventi multi-data."""
+    """Recupera le occorrenze future per eventi multi-data (con cache)."""
     if from_date is None: from_date = "2020-01-01"
-    base_api = UNPLI_API_BASE_URL.rstrip('/')
-    url = f"{base_api}/{dbCode}/{event_id}"
-    fields_value = f'nextOccurrences(fromDate:"{from_date}",count:100){{items{{date,dayOfWeek,startTime,duration}},hasMoreItems}}'
-    params = {"fields": fields_value}
-    headers = {
-        "DW-Source": "desklineweb", 
-        "DW-SessionID": session_id,
-        "Accept": "application/json, text/plain, */*", 
-        "Referer": "https://www.unpliveneto.it/",
-        "User-Agent": "Mozilla/5.0"
-    }
+    key = (dbCode, event_id, from_date)
+    future = _details_cache.get(key)
+    if future is not None:
+        return await asyncio.shield(future)
+
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    _details_cache[key] = future
+    try:
+        dates = await _fetch_event_details_dates_uncached(session, dbCode, event_id, session_id, from_date, max_retries)
+    except BaseException as e:
+        _details_cache.pop(key, None)
+        future.set_exception(e)
+        future.exception()  # mark retrieved when nobody else is waiting
+        raise
+
+    future.set_result(dates)
+    if not dates:
+        # Empty may be a transient failure (retries exhausted): let the next call retry
+        _details_cache.pop(key, None)
+    else:
+        loop.call_later(DETAILS_CACHE_TTL, _details_cache.pop, key, None)
+    return dates
+
+async def _fetch_event_details_dates_uncached(
+    session: httpx.AsyncClient,
+    dbCode: str,
+    event_id: str,
+    session_id: str,
+    from_date: str,
+    max_retries: int
+) -> List[Tuple[str, str, int]]:
+    url = f"{UNPLI_DETAILS_BASE_URL}/{dbCode}/{event_id}"
+    params = {"fields": UNPLI_OCCURRENCES_FIELDS.format(from_date=from_date)}
+    headers = {"DW-SessionID": session_id}
     backoff = 1
     for attempt in range(max_retries):
         try:
+            await UNPLI_LIMITER.acquire()
             response = await session.get(url, headers=headers, params=params)
             if response.status_code == 429:
-                await asyncio.sleep(backoff)
+                retry_after = response.headers.get("Retry-After", "")
+                UNPLI_LIMITER.penalize(int(retry_after) if retry_after.isdigit() else backoff)
                 backoff = min(backoff * 2, 60)
                 continue
             response.raise_for_status()
-            data = response.json()
+            data = orjson.loads(response.content)
             items = data.get("nextOccurrences", {}).get("items", [])
             dates_with_info = []
             for item in items:
@@ -93,88 +185,90 @@ async def fetch_event_details_dates(
                     d = item['date'][:10]
                     t = item.get('startTime', '00:00')
                     dates_with_info.append((d, t, item.get("duration", 0)))
-            await asyncio.sleep(0.5)
             return dates_with_info
         except:
             await asyncio.sleep(backoff)
     return []
 
-async def transform_events_for_json(events: List[Dict], session_id: str = UNPLI_SESSION_ID) -> List[Dict]:
-    """Trasforma i dati nel formato piatto con supporto HTTPS e start_localdate."""
+async def transform_events_for_json(
+    events: List[Dict],
+    session_id: str = UNPLI_SESSION_ID,
+    session: Optional[httpx.AsyncClient] = None,
+) -> List[Dict]:
+    """Trasforma i dati nel formato piatto con supporto HTTPS e start_localdate.
+    Senza `session` usa il client condiviso `unpli_http_client` (connessioni keep-alive riusate)."""
     transformed = []
-    async with httpx.AsyncClient() as session:
-        for event in events:
-            # Estrazione campi base
-            descriptions = event.get("descriptions") or []
-            long_description = clean_html(descriptions[0].get("description", "")) if descriptions else ""
-            location = event.get("location") or {}
-            coordinate = location.get("coordinate") or {}
-            venue, city = location.get("place", ""), location.get("town", "")
-            title = event.get("name", "")
-            criteria = event.get("criteria") or []
-            category = criteria[0].get("groupName", "") if criteria and criteria[0] else ""
-            db_code, event_id, url_friendly = event.get("dbCode", ""), event.get("id", ""), event.get("urlFriendlyName", "")
-            event_url = f"{UNPLI_WEB_BASE_URL.rstrip('/')}/{db_code}/{event_id}/{url_friendly}" if db_code else UNPLI_WEB_BASE_URL
-            
-            # --- LOGICA IMMAGINI CON FIX HTTPS ---
-            image_url = None
-            images = event.get("images", [])
-            if images:
-                image_urls = images[0].get("urls", [])
-                if image_urls and len(image_urls) > 0:
-                    raw_url = image_urls[0]
-                    image_url = f"https:{raw_url}" if raw_url.startswith("//") else raw_url
-
-            # Gestione occorrenze date
-            raw_occurrences = []
-            if event.get("hasMoreDates", False):
-                raw_occurrences = await fetch_event_details_dates(session, db_code, event_id, session_id, event.get("date")[:10])
-            
-            if not raw_occurrences:
-                full_date_str = event.get("date", "")
-                d_part = full_date_str[:10]
-                t_part = full_date_str.split("T")[1][:5] if "T" in full_date_str else "00:00"
-                raw_occurrences = [(d_part, t_part, 0)]
-
-            for date_part, time_part, duration_hours in raw_occurrences:
-                if time_part in ["00:00", "00:00:00"]:
-                    current_localtime = ""
-                    final_start_date = date_part
-                else:
-                    current_localtime = time_part[:5]
-                    final_start_date = f"{date_part}T{current_localtime}:00"
-
-                try:
-                    dt_start = datetime.strptime(f"{date_part} {time_part[:5]}", "%Y-%m-%d %H:%M")
-                    if duration_hours > 0:
-                        dt_end = dt_start + timedelta(hours=duration_hours)
-                        if dt_end.date() > dt_start.date():
-                            dt_end = dt_start.replace(hour=23, minute=59, second=59)
-                    else:
-                        dt_end = dt_start.replace(hour=23, minute=59, second=59)
-                    end_date = dt_end.isoformat()
-                except:
-                    end_date = f"{date_part}T23:59:59"
-
-                transformed.append({
-                    "id": f"UN_{event_id}",
-                    "title": title,
-                    "category": category,
-                    "description": long_description,
-                    "city": city,
-                    "location": {
-                        "venue": venue, 
-                        "address": f"{venue}, {city}" if venue and city else venue or city,
-                        "lat": coordinate.get("lat"), 
-                        "lon": coordinate.get("long")
-                    },
-                    "start_date": final_start_date,
-                    "start_localtime": current_localtime,
-                    "start_localdate": date_part,  # <--- AGGIUNTO QUI
-                    "end_date": end_date,
-                    "url": event_url,
-                    "credits": "Dms Veneto, il Destination Management System di Regione del Veneto",
-                    "image_url": image_url
-                })
+    session = session or unpli_http_client
+    # Multi-date lookups run concurrently (bounded); UNPLI_LIMITER paces them and
+    # absorbs 429s instead of a fixed pause per call
+    details_slots = asyncio.Semaphore(DETAILS_CONCURRENCY)
+
+    async def occurrences_for(event: Dict) -> List[Tuple[str, str, int]]:
+        if not event.get("hasMoreDates", False):
+            return []
+        async with details_slots:
+            return await fetch_event_details_dates(session, event.get("dbCode", ""), event.get("id", ""), session_id, event.get("date")[:10])
+
+    all_occurrences = await asyncio.gather(*(occurrences_for(event) for event in events))
+
+    for event, raw_occurrences in zip(events, all_occurrences):
+        # Estrazione campi base
+        descriptions = event.get("descriptions") or []
+        long_description = clean_html(descriptions[0].get("description", "")) if descriptions else ""
+        location = event.get("location") or {}
+        coordinate = location.get("coordinate") or {}
+        venue, city = location.get("place", ""), location.get("town", "")
+        title = event.get("name", "")
+        criteria = event.get("criteria") or []
+        category = criteria[0].get("groupName", "") if criteria and criteria[0] else ""
+        db_code, event_id, url_friendly = event.get("dbCode", ""), event.get("id", ""), event.get("urlFriendlyName", "")
+        event_url = f"{UNPLI_WEB_BASE_URL.rstrip('/')}/{db_code}/{event_id}/{url_friendly}" if db_code else UNPLI_WEB_BASE_URL
+        
+        # --- LOGICA IMMAGINI CON FIX HTTPS ---
+        image_url = None
+        images = event.get("images", [])
+        if images:
+            image_urls = images[0].get("urls", [])
+            if image_urls and len(image_urls) > 0:
+                raw_url = image_urls[0]
+                image_url = f"https:{raw_url}" if raw_url.startswith("//") else raw_url
+
+        # Gestione occorrenze date
+        if not raw_occurrences:
+            full_date_str = event.get("date", "")
+            d_part = full_date_str[:10]
+            t_part = full_date_str.split("T")[1][:5] if "T" in full_date_str else "00:00"
+            raw_occurrences = [(d_part, t_part, 0)]
+
+        end_dates = occurrence_end_dates(raw_occurrences)
+        for (date_part, time_part, _), end_date in zip(raw_occurrences, end_dates):
+            if time_part in ["00:00", "00:00:00"]:
+                current_localtime = ""
+                final_start_date = date_part
+            else:
+                current_localtime = time_part[:5]
+                final_start_date = f"{date_part}T{current_localtime}:00"
+
+
+            transformed.append({
+                "id": f"UN_{event_id}",
+                "title": title,
+                "category": category,
+                "description": long_description,
+                "city": city,
+                "location": {
+                    "venue": venue, 
+                    "address": f"{venue}, {city}" if venue and city else venue or city,
+                    "lat": coordinate.get("lat"), 
+                    "lon": coordinate.get("long")
+                },
+                "start_date": final_start_date,
+                "start_localtime": current_localtime,
+                "start_localdate": date_part,  # <--- AGGIUNTO QUI
+                "end_date": end_date,
+                "url": event_url,
+                "credits": "Dms Veneto, il Destination Management System di Regione del Veneto",
+                "image_url": image_url
+            })
     
     return transformed
\ No newline at end of file
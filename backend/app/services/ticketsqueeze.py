@@ -1,22 +1,22 @@
+import asyncio
 import pandas as pd
-import json
+import orjson
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import Iterator, List, Dict, Any, Optional, Tuple
 from datetime import datetime
+from functools import lru_cache
+from collections import Counter
 import logging
-import unicodedata
+from app.services.csv_delta_service import iter_csv_as_strings
 
 # Logging Setup
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def normalize_text(text: Optional[str]) -> str:
-    """Normalize text matching ingest_service.py exactly."""
-    if not text:
-        return ""
-    text = str(text).strip()
-    text = unicodedata.normalize("NFKC", text)
-    return text
+def normalize_column(values: pd.Series) -> pd.Series:
+    """Normalize a string column (strip + NFKC) matching ingest_service.py, one vectorized pass."""
+    # NFKC leaves ASCII untouched, so the whole column goes through str.normalize
+    return values.str.strip().str.normalize("NFKC")
 
 def parse_iso_datetime(date_str: str, default_time: str = "00:00:00") -> Optional[str]:
     """Parse date/time to strict ISO 8601 format for Qdrant (NO Z suffix)."""
@@ -26,7 +26,11 @@ def parse_iso_datetime(date_str: str, default_time: str = "00:00:00") -> Optiona
     date_str = date_str.strip()
     if not date_str:
         return None
-    
+    return _parse_iso_cached(date_str, default_time)
+
+# Distinct dates repeat across the batches of one delta (cleared after each transform)
+@lru_cache(maxsize=4096)
+def _parse_iso_cached(date_str: str, default_time: str) -> Optional[str]:
     try:
         # Handles full ISO formats or just date strings
         if 'T' in date_str or ' ' in date_str:
@@ -37,106 +41,153 @@ def parse_iso_datetime(date_str: str, default_time: str = "00:00:00") -> Optiona
             dt = datetime.fromisoformat(f"{date_str}T{default_time}")
         return dt.isoformat() 
     except ValueError:
-        logger.warning(f"Invalid datetime format: '{date_str}'")
+        # Reported once per column by parse_iso_column
         return None
 
-def parse_ticketsqueeze_csv(csv_path: Path) -> pd.DataFrame:
-    """Read a TicketSqueeze CSV file and return as DataFrame."""
+def parse_ticketsqueeze_csv(csv_path: Path) -> Iterator[pd.DataFrame]:
+    """Read a TicketSqueeze CSV file as a stream of DataFrame batches."""
     if not csv_path.exists():
         raise FileNotFoundError(f"CSV file not found: {csv_path}")
     
-    # dtype=str prevents IDs from being turned into floats (e.g. 123.0)
-    df = pd.read_csv(csv_path, dtype=str).fillna("")
-    return df
+    # All-string columns (IDs must not become floats, e.g. 123.0), parsed by the
+    # PyArrow reader shared with the delta computation; batches keep large deltas
+    # from being materialized as one object-dtype DataFrame
+    return iter_csv_as_strings(csv_path)
+
+# Candidate source columns per output field, in priority order (TicketSqueeze exports
+# and delta CSVs name them differently)
+FIELD_SOURCES = {
+    "id": ["event_id", "id", "Event ID"],
+    "title": ["title", "name", "event_name", "Event Name"],
+    "category": ["category", "category_name", "Category Name"],
+    "description": ["description", "event_description"],
+    "city": ["city", "venue_city", "venue_city_name", "City Name"],
+    "venue": ["venue", "venue_name", "Venue Name"],
+    "address": ["address", "venue_address", "street_address", "Address"],
+    "lat": ["latitude", "lat", "geolocation_latitude", "Latitude"],
+    "lon": ["longitude", "lon", "geolocation_longitude", "Longitude"],
+    "start_date": ["start_date", "event_date", "date", "Date"],
+    "start_time": ["start_time", "event_time", "time", "Time"],
+    "end_date": ["end_date", "event_date", "date", "Date"],
+    "end_time": ["end_time"],
+    "url": ["url", "event_url", "ticket_url", "Ticket URL"],
+}
+DELTA_PREFIXES = ("new_", "old_")
 
-def map_ticketsqueeze_to_event(row: Dict[str, str], delta_type: str) -> Dict[str, Any]:
+@lru_cache(maxsize=16)
+def delta_column_plan(columns: Tuple[str, ...]) -> Tuple[Dict[str, List[str]], List[str], Dict[str, List[str]]]:
     """
-    Transform a TicketSqueeze row to match expected schema.
-    Defensive mapping: looks for 'new_', 'old_', or raw column names.
+    Per column set (every batch of a delta, and the daily files, share one):
+    base name -> its new_/old_/raw sources, passthrough columns, field -> present candidates.
     """
-    
-    def get_val(keys: List[str]) -> str:
-        """Helper to try multiple possible column names and prefixes."""
-        for k in keys:
-            # Check prefixes first (for Delta CSV compatibility)
-            for prefix in ["new_", "old_", ""]:
-                full_key = f"{prefix}{k}"
-                if full_key in row and row[full_key]:
-                    return normalize_text(row[full_key])
-        return ""
-
-    # 1. CORE IDENTITY
-    # Matches the key used in csv_delta_service.py
-    event_id = get_val(["event_id", "id", "Event ID"])
-    title = get_val(["title", "name", "event_name", "Event Name"])
-    category = get_val(["category", "category_name", "Category Name"])
-    
-    # 2. DESCRIPTION & CITY
-    description = get_val(["description", "event_description"]) or title
-    city = get_val(["city", "venue_city", "venue_city_name", "City Name"])
-    
-    # 3. LOCATION OBJECT
-    venue = get_val(["venue", "venue_name", "Venue Name"])
-    venue_addr = get_val(["address", "venue_address", "street_address", "Address"])
-    
-    # Construct address string for search/display
-    full_address = f"{venue_addr}, {city}".strip(", ")
+    present = set(columns)
+    bases = dict.fromkeys(c[4:] for c in columns if c.startswith(DELTA_PREFIXES))
+    merges = {base: [c for c in (f"new_{base}", f"old_{base}", base) if c in present] for base in bases}
+    rest = [c for c in columns if not c.startswith(DELTA_PREFIXES) and c not in merges]
+    collapsed = set(rest) | set(merges)
+    fields = {field: [c for c in keys if c in collapsed] for field, keys in FIELD_SOURCES.items()}
+    return merges, rest, fields
 
-    # COORDINATES (Parsed as floats)
-    lat, lon = None, None
-    try:
-        lat_val = get_val(["latitude", "lat", "geolocation_latitude", "Latitude"])
-        lon_val = get_val(["longitude", "lon", "geolocation_longitude", "Longitude"])
-        if lat_val: 
-            lat = float(lat_val)
-        if lon_val: 
-            lon = float(lon_val)
-    except (ValueError, TypeError):
-        pass
-
-    # 4. DATE MANAGEMENT
-    # TS usually provides 'Date' and 'Time' columns
-    start_date_raw = get_val(["start_date", "event_date", "date", "Date"])
-    start_time_raw = get_val(["start_time", "event_time", "time", "Time"])
-    
-    end_date_raw = get_val(["end_date", "event_date", "date", "Date"])
-    end_time_raw = get_val(["end_time"])
+def collapse_delta_prefixes(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Merge Delta CSV 'new_X'/'old_X' columns into a single 'X' column, once per DataFrame
+    (first non-empty of new_X, old_X, then an unprefixed X).
+    """
+    merges, rest, _ = delta_column_plan(tuple(df.columns))
+    if not merges:
+        return df
+    merged = {}
+    for base, sources in merges.items():
+        out = pd.Series("", index=df.index, dtype=object)
+        for col in sources:
+            out = out.where(out != "", df[col])
+        merged[base] = out
+    return pd.concat([df[rest], pd.DataFrame(merged, index=df.index)], axis=1)
 
-    start_date_iso = None
-    if start_date_raw:
-        if start_time_raw and ":" in start_time_raw:
-            start_date_iso = parse_iso_datetime(f"{start_date_raw} {start_time_raw}")
-        else:
-            start_date_iso = parse_iso_datetime(start_date_raw)
-    
-    end_date_iso = None
-    if end_date_raw:
-        if end_time_raw and ":" in end_time_raw:
-            end_date_iso = parse_iso_datetime(f"{end_date_raw} {end_time_raw}")
-        else:
-            # Default end time to end of day if only date is present
-            end_date_iso = parse_iso_datetime(end_date_raw, default_time="23:59:59")
-    
-    url = get_val(["url", "event_url", "ticket_url", "Ticket URL"])
-
-    return {
-        "id": event_id,
-        "title": title,
-        "category": category,
-        "description": description,
-        "city": city,
-        "location": {
-            "venue": venue or None,
-            "address": full_address or None,
-            "lat": lat,
-            "lon": lon
-        },
-        "start_date": start_date_iso,
-        "end_date": end_date_iso,
-        "url": url,
-        "credits": "TicketSqueeze - Events Data",
-        "delta_type": delta_type
-    }
+def pick_column(df: pd.DataFrame, field: str) -> pd.Series:
+    """First non-empty value among the field's candidate columns, normalized."""
+    out = pd.Series("", index=df.index, dtype=object)
+    for col in delta_column_plan(tuple(df.columns))[2][field]:
+        out = out.where(out != "", df[col])
+    return normalize_column(out)
+
+def parse_iso_column(dates: pd.Series, times: pd.Series, default_time: str) -> List[Optional[str]]:
+    """Column-wise date(+time) parsing; each distinct value is parsed once (feeds repeat dates a lot)."""
+    raw = dates.where(~times.str.contains(":", regex=False), dates + " " + times)
+    parsed = {v: parse_iso_datetime(v, default_time=default_time) for v in pd.unique(raw[dates != ""])}
+    invalid = [v for v, p in parsed.items() if p is None and v.strip()]
+    if invalid:
+        logger.warning("Invalid datetime format in %d distinct values, e.g. '%s'", len(invalid), invalid[0])
+    return [parsed[r] if d else None for r, d in zip(raw, dates)]
+
+def parse_float_column(values: pd.Series) -> pd.Series:
+    """Floats for non-empty parsable cells, NaN otherwise."""
+    return pd.to_numeric(values.where(values != ""), errors="coerce").astype("float64")
+
+def events_df_to_records(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """
+    Transform TicketSqueeze rows to match expected schema.
+    Computed one column at a time (one pass per field instead of ~20 dict lookups per row).
+    """
+    df = collapse_delta_prefixes(df)
+    event_id = pick_column(df, "id")
+    title = pick_column(df, "title")
+    category = pick_column(df, "category")
+    description = pick_column(df, "description")
+    description = description.where(description != "", title)
+    city = pick_column(df, "city")
+    venue = pick_column(df, "venue")
+    venue_addr = pick_column(df, "address")
+    # "addr, city", or whichever of the two is present
+    full_address = venue_addr.where(city == "", venue_addr + ", " + city).where(venue_addr != "", city)
+
+    # COORDINATES (Parsed as floats); an unparsable latitude also drops the longitude
+    lat_raw = pick_column(df, "lat")
+    lon_raw = pick_column(df, "lon")
+    lat = parse_float_column(lat_raw)
+    lon = parse_float_column(lon_raw).mask((lat_raw != "") & lat.isna())
+
+    # Without explicit start_date/end_date columns both resolve to the same event date column
+    start_raw = pick_column(df, "start_date")
+    fields = delta_column_plan(tuple(df.columns))[2]
+    end_raw = start_raw if fields["end_date"] == fields["start_date"] else pick_column(df, "end_date")
+    start_date = parse_iso_column(
+        start_raw,
+        pick_column(df, "start_time"),
+        default_time="00:00:00",
+    )
+    end_date = parse_iso_column(
+        end_raw,
+        pick_column(df, "end_time"),
+        default_time="23:59:59",
+    )
+    url = pick_column(df, "url")
+    delta_types = df["delta_type"] if "delta_type" in df.columns else pd.Series("added", index=df.index)
+
+    return [
+        {
+            "id": eid,
+            "title": t,
+            "category": cat,
+            "description": desc,
+            "city": c,
+            "location": {
+                "venue": v or None,
+                "address": addr or None,
+                "lat": None if la != la else la,
+                "lon": None if lo != lo else lo
+            },
+            "start_date": sd,
+            "end_date": ed,
+            "url": u,
+            "credits": "TicketSqueeze - Events Data",
+            "delta_type": dt
+        }
+        for eid, t, cat, desc, c, v, addr, la, lo, sd, ed, u, dt in zip(
+            event_id, title, category, description, city, venue, full_address,
+            lat.tolist(), lon.tolist(), start_date, end_date, url, delta_types
+        )
+    ]
 
 async def transform_ticketsqueeze_delta_to_json(
     csv_path: Path,
@@ -144,39 +195,46 @@ async def transform_ticketsqueeze_delta_to_json(
     include_changed: bool = True
 ) -> List[Dict[str, Any]]:
     """Processes delta.csv into structured events list for Ingest Service."""
-    df = parse_ticketsqueeze_csv(csv_path)
-    events = []
+    events: List[Dict[str, Any]] = []
+    rows = 0
+    counts: Counter = Counter()
+    # Filter based on user preference: one isin() per batch
+    excluded = [t for t, include in (("removed", include_removed), ("changed", include_changed)) if not include]
+    try:
+        for df in parse_ticketsqueeze_csv(csv_path):
+            if df.empty:
+                continue
+
+            dtypes = df["delta_type"] if "delta_type" in df.columns else pd.Series("added", index=df.index)
+            keep = ~dtypes.isin(excluded)
+            rows += len(df)
+            df = df[keep]
 
-    if df.empty:
+            # Validates that we at least have an ID before adding
+            batch = [event for event in events_df_to_records(df) if event["id"]]
+            if len(batch) < len(df):
+                logger.debug("Skipped %d rows missing ID", len(df) - len(batch))
+            events.extend(batch)
+            counts.update(event["delta_type"] for event in batch)
+    finally:
+        _parse_iso_cached.cache_clear()
+
+    if not rows:
         logger.warning("Delta CSV is empty.")
         return []
 
-    # Iterate once through the dataframe
-    for _, row in df.iterrows():
-        dtype = row.get("delta_type", "added")
-        
-        # Filter based on user preference
-        if dtype == "removed" and not include_removed: continue
-        if dtype == "changed" and not include_changed: continue
-
-        row_dict = row.to_dict()
-        event = map_ticketsqueeze_to_event(row_dict, dtype)
-        
-        # Validates that we at least have an ID and Title before adding
-        if event["id"]:
-            events.append(event)
-        else:
-            logger.debug(f"Skipping row missing ID. Raw data: {row_dict}")
-
-    logger.info(f"✅ Transformed {len(events)} events (Mode: {dtype})")
+    logger.info("✅ Transformed %d events %s", len(events), dict(counts))
     return events
 
-def save_events_to_json(events: List[Dict[str, Any]], output_path: Path) -> None:
-    """Saves the event list to the JSON format expected by the system."""
+def _write_events_json(events: List[Dict[str, Any]], output_path: Path) -> None:
     output_path.parent.mkdir(parents=True, exist_ok=True)
-    with open(output_path, "w", encoding="utf-8") as f:
-        json.dump({"events": events}, f, indent=2, ensure_ascii=False)
-    logger.info(f"Saved {len(events)} events to {output_path}")
+    output_path.write_bytes(orjson.dumps({"events": events}, option=orjson.OPT_INDENT_2))
+
+async def save_events_to_json(events: List[Dict[str, Any]], output_path: Path) -> None:
+    """Saves the event list to the JSON format expected by the system."""
+    # Serializing + writing a large delta blocks for a while: keep it off the event loop
+    await asyncio.to_thread(_write_events_json, events, output_path)
+    logger.info("Saved %d events to %s", len(events), output_path)
 
 async def process_ticketsqueeze_daily_delta(
     delta_csv_path: Path,
@@ -192,7 +250,7 @@ async def process_ticketsqueeze_daily_delta(
     )
     
     if output_json_path:
-        save_events_to_json(events, output_json_path)
+        await save_events_to_json(events, output_json_path)
     
     summary = {
         "total_events": len(events),
@@ -1,9 +1,10 @@
-import json
+import orjson
 import logging
 import urllib.parse
 import os
 from pathlib import Path
 from typing import List, Dict, Any
+from functools import lru_cache
 
 # Importiamo la configurazione centralizzata dal tuo config.py
 from app.core.config import IMPACT_BASE_URL, IMPACT_MEMBER_ID, TM_PROVIDER_PREFIX
@@ -13,6 +14,19 @@ logger = logging.getLogger(__name__)
 # Utilizziamo il prefisso dal config (che lo legge dal .env)
 TM_PREFIX = TM_PROVIDER_PREFIX or "TM"
 
+@lru_cache(maxsize=8192)
+def _wrap_impact(original_url: str) -> str:
+    """URL tracciato Impact (una volta per URL: i dump successivi ripetono gli stessi eventi)."""
+    if IMPACT_MEMBER_ID not in original_url:
+        return f"{IMPACT_BASE_URL}{urllib.parse.quote(original_url, safe='')}"
+    return original_url
+
+def _wrap_direct(original_url: str) -> str:
+    return original_url
+
+# Politica di affiliazione scelta una volta al caricamento (la config non cambia a runtime)
+wrap_affiliate_url = _wrap_impact if IMPACT_MEMBER_ID else _wrap_direct
+
 def transform_tm_event(tm_event: Dict[str, Any]) -> Dict[str, Any]:
     """
     Trasforma un singolo evento dal feed Ticketmaster al formato standard ReMap.
@@ -26,14 +40,7 @@ def transform_tm_event(tm_event: Dict[str, Any]) -> Dict[str, Any]:
     
     # --- 2. LOGICA AFFILIAZIONE INTELLIGENTE ---
     original_url = tm_event.get("primaryEventUrl", "")
-    affiliate_url = original_url
-    
-    if original_url:
-        if IMPACT_MEMBER_ID and IMPACT_MEMBER_ID not in original_url:
-            encoded_url = urllib.parse.quote(original_url, safe='')
-            affiliate_url = f"{IMPACT_BASE_URL}{encoded_url}"
-        else:
-            affiliate_url = original_url
+    affiliate_url = wrap_affiliate_url(original_url) if original_url else original_url
 
     # --- 3. ESTRAZIONE DATE & TIME ---
     start_dt = tm_event.get("eventStartDateTime")
@@ -71,23 +78,22 @@ def load_and_transform_tm_file(file_path: Path) -> List[Dict[str, Any]]:
     trasformati e pronti per l'ingestione.
     """
     if not file_path.exists():
-        logger.error(f"❌ File non trovato: {file_path}")
+        logger.error("❌ File non trovato: %s", file_path)
         return []
     
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            
-            if isinstance(data, list):
-                events_list = data
-            elif isinstance(data, dict) and "events" in data:
-                events_list = data["events"]
-            else:
-                logger.warning(f"⚠️ Formato JSON inatteso in {file_path.name}")
-                events_list = []
-                
-            return [transform_tm_event(e) for e in events_list]
+        data = orjson.loads(file_path.read_bytes())
+
+        if isinstance(data, list):
+            events_list = data
+        elif isinstance(data, dict) and "events" in data:
+            events_list = data["events"]
+        else:
+            logger.warning("⚠️ Formato JSON inatteso in %s", file_path.name)
+            events_list = []
+
+        return [transform_tm_event(e) for e in events_list]
             
     except Exception as e:
-        logger.error(f"❌ Errore durante la trasformazione del file {file_path}: {e}")
+        logger.error("❌ Errore durante la trasformazione del file %s: %s", file_path, e)
         return []
\ No newline at end of file
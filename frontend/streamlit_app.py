@@ -1,9 +1,15 @@
 import streamlit as st
 import streamlit.components.v1 as components
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from datetime import datetime, timedelta, date
 import json
+import html
+import hashlib
+import orjson
 import os
+from urllib.parse import urlsplit
 
 
 
@@ -14,36 +20,110 @@ CREATE_MAP_URL = f"{API_BASE_URL}/create_map"
 SENTENCE_TO_PAYLOAD_URL = f"{API_BASE_URL}/sentencetopayload"
 
 
+OL_JS_URL = "https://cdn.jsdelivr.net/npm/ol@7.3.0/dist/ol.js"
+OL_CSS_URL = "https://cdn.jsdelivr.net/npm/ol@7.3.0/ol.css"
+
+# (connect, read) seconds: create_map geocodes + routes, sentencetopayload runs the LLM extraction
+REQUEST_TIMEOUT = (5, 120)
+
 st.set_page_config(layout="wide")
 
 
+@st.cache_resource
+def get_http_session():
+    """One pooled keep-alive session per server process (survives Streamlit reruns)."""
+    session = requests.Session()
+    retries = Retry(
+        total=3,
+        read=0,  # never re-send after a read timeout: a slow create_map / LLM call would run again
+        backoff_factor=0.3,
+        status_forcelist=[502, 503, 504],
+        raise_on_status=False,  # last 5xx response reaches _post_json -> ApiError -> st.error
+        allowed_methods=frozenset({"POST"}),  # only connect errors and gateway statuses are retried
+    )
+    adapter = HTTPAdapter(pool_connections=10, pool_maxsize=20, max_retries=retries)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class ApiError(Exception):
+    """Non-200 backend response; raised (not returned) so st.cache_data never caches it."""
+
+    def __init__(self, status_code, text):
+        super().__init__(f"{status_code}: {text}")
+        self.status_code = status_code
+        self.text = text
+
+
+def _post_json(url, body_json):
+    response = get_http_session().post(
+        url, data=body_json, headers={"Content-Type": "application/json"}, timeout=REQUEST_TIMEOUT
+    )
+    if response.status_code != 200:
+        raise ApiError(response.status_code, response.text)
+    return response.json()
+
+
+# Identical requests (repeat searches, reruns) are served from the cache. Short TTL: events
+# are re-ingested daily and sentences like "tomorrow" depend on the current date.
+@st.cache_data(ttl=60 * 60, max_entries=256, show_spinner=False)
+def _cached_create_map(payload_json):
+    return _post_json(CREATE_MAP_URL, payload_json)
+
+
+@st.cache_data(ttl=60 * 60, max_entries=256, show_spinner=False)
+def _cached_sentence_to_payload(sentence):
+    return _post_json(SENTENCE_TO_PAYLOAD_URL, json.dumps({"sentence": sentence}))
+
+
+def warm_map_assets():
+    """
+    Let the browser fetch OpenLayers and open the tile/icon connections while the
+    backend is still working, instead of after the map HTML arrives.
+    Once per session: after that the assets are in the browser cache.
+    """
+    if st.session_state.get("map_assets_warmed"):
+        return
+    st.session_state["map_assets_warmed"] = True
+    components.html(
+        f"""
+        <link rel="preconnect" href="https://cdn.jsdelivr.net">
+        <link rel="preconnect" href="https://tile.openstreetmap.org">
+        <link rel="preconnect" href="https://raw.githubusercontent.com">
+        <link rel="preload" as="script" href="{OL_JS_URL}">
+        <link rel="preload" as="style" href="{OL_CSS_URL}">
+        """,
+        height=0,
+    )
+
+
 def call_create_map(payload):
+    warm_map_assets()
     with st.spinner("Querying events..."):
-        response = requests.post(CREATE_MAP_URL, json=payload)
-    if response.status_code == 200:
-        data = response.json()
-        if "message" in data:
-            st.warning(data["message"])
-            return None
-        required_keys = ("origin", "destination", "route_coords", "buffer_polygon")
-        if not all(k in data for k in required_keys):
-            st.error("Incomplete route data received from backend.")
+        try:
+            data = _cached_create_map(json.dumps(payload, sort_keys=True))
+        except ApiError as e:
+            st.error(f"API call failed with status {e.status_code}: {e.text}")
             return None
-        return data
-    else:
-        st.error(f"API call failed with status {response.status_code}: {response.text}")
+    if "message" in data:
+        st.warning(data["message"])
+        return None
+    required_keys = ("origin", "destination", "route_coords", "buffer_polygon")
+    if not all(k in data for k in required_keys):
+        st.error("Incomplete route data received from backend.")
         return None
+    return data
 
 
 def call_sentence_to_payload(sentence: str):
     with st.spinner("Extracting parameters from natural language input..."):
-        response = requests.post(SENTENCE_TO_PAYLOAD_URL, json={"sentence": sentence})
-    if response.status_code == 200:
-        payload = response.json()
-        return payload
-    else:
-        st.error(f"Failed to extract parameters: {response.text}")
-        return None
+        try:
+            # Whitespace-insensitive key: re-typed sentences hit the exact cache
+            return _cached_sentence_to_payload(" ".join(sentence.split()))
+        except ApiError as e:
+            st.error(f"Failed to extract parameters: {e.text}")
+            return None
 
 
     mode = st.radio("Select input mode", ["Input manually", "Input natural language"], horizontal=True)
@@ -51,11 +131,17 @@ def call_sentence_to_payload(sentence: str):
 def main():
     mode = st.radio("Select input mode", ["Input manually", "Input natural language"], horizontal=True)
 
+    if st.sidebar.button("Clear cache", help="Forget cached searches and extracted parameters"):
+        _cached_create_map.clear()
+        _cached_sentence_to_payload.clear()
+
     # Clear route data and extracted_payload if mode changes
     previous_mode = st.session_state.get("input_mode")
     if previous_mode != mode:
         st.session_state.pop("route_data", None)
+        st.session_state.pop("route_data_key", None)
         st.session_state.pop("extracted_payload", None)
+        st.session_state.pop("route_addresses", None)
         st.session_state["input_mode"] = mode
 
     data = st.session_state.get("route_data")
@@ -72,76 +158,11 @@ def main():
         col1, col2, col3 = st.columns([1, 2, 2])
 
         with col1:
-            #st.subheader("Insert data")
-
-            origin_address = st.text_input("Origin Address", value="Padova")
-            destination_address = st.text_input("Destination Address", value="Verona")
-            buffer_distance = st.number_input("Buffer Distance (km)", min_value=0, value=5)
-
-            query_text = st.text_input("Search Query Text", value="")
-            numevents = st.number_input("Number of Events to Retrieve", min_value=1, value=10)
-
-            profile_choice_user = st.selectbox(
-                "Transport Profile",
-                options=["car", "bike", "walking"],
-                index=0,
-                help="Select the transport profile for routing"
-            )
-
-            start_col1, start_col2 = st.columns(2)
-            with start_col1:
-                # start_date = st.date_input("Start Date", value=datetime.today())
-                start_date = st.date_input("Start Date", value=datetime.today())
-
-            with start_col2:
-                if 'start_time' not in st.session_state:
-                    st.session_state.start_time = datetime.now().time()
-                start_time = st.time_input("Start Time", key='start_time')
-
-            end_col1, end_col2 = st.columns(2)
-            with end_col1:
-                end_date = st.date_input("End Date", value=datetime.today() + timedelta(days=4))
-            with end_col2:
-                if 'end_time' not in st.session_state:
-                    st.session_state.end_time = datetime.now().time()
-                end_time = st.time_input("End Time", key='end_time')
-
-            error_msgs = []
-            if end_date < start_date:
-                error_msgs.append("End Date cannot be earlier than Start Date.")
-            if end_date == start_date and end_time < start_time:
-                error_msgs.append("If Start Date and End Date are the same, End Time cannot be earlier than Start Time.")
-
-            if error_msgs:
-                for msg in error_msgs:
-                    st.error(msg)
-            else:
-                startinputdate = datetime.combine(start_date, start_time).isoformat()
-                endinputdate = datetime.combine(end_date, end_time).isoformat()
-
-            search_disabled = len(error_msgs) > 0
-
-
-            if st.button("Search Events", disabled=search_disabled):
-                payload = {
-                    "origin_address": origin_address,
-                    "destination_address": destination_address,
-                    "buffer_distance": buffer_distance,
-                    "startinputdate": startinputdate,
-                    "endinputdate": endinputdate,
-                    "query_text": query_text,
-                    "numevents": numevents,
-                    "profile_choice": profile_map.get(profile_choice_user, "driving-car"),
-                }
-
-                data = call_create_map(payload)
-
-                if data:
-                    st.session_state["route_data"] = data
-
+            manual_search_form(profile_map)
 
         with col2:
             if data:
+                origin_address, destination_address = st.session_state.get("route_addresses", ("Origin", "Destination"))
                 display_map_and_events(data, origin_address, destination_address)
             else:
                 st.info("Compile the data and press 'Search Events' to display the route map and events.")
@@ -152,37 +173,7 @@ def main():
         col1, col2, col3 = st.columns([1, 2, 2])
 
         with col1:
-            st.subheader("Natural Language Input")
-
-            sentence_input = st.text_area(
-                "Enter your travel plan as a sentence",
-                height=200,
-                placeholder=(
-                    "Always specify the year in the dates and the type of transport (car, bike, or foot).\n"
-                    "Example: I want to go from Vicenza to Trento "
-                    "and will leave on 2 September 2025 at 2 a.m., arriving on 18 October 2025 at 5:00 a.m."
-                    "Give me 10 events about music within a 6 km range. Use bike as transport."
-                )
-            )
-            
-            if st.button("Parse and Search"):
-                if not sentence_input.strip():
-                    st.error("Please enter a sentence.")
-                    st.session_state['extracted_payload'] = None
-                else:
-                    extracted_payload = call_sentence_to_payload(sentence_input)
-                    if extracted_payload:
-                        st.session_state['extracted_payload'] = extracted_payload
-                        data = call_create_map(extracted_payload)
-                        if data:
-                            st.session_state["route_data"] = data
-                    else:
-                        st.session_state['extracted_payload'] = None
-
-            # Display extracted JSON below the button
-            if 'extracted_payload' in st.session_state and st.session_state['extracted_payload'] is not None:
-                st.subheader("Extracted Parameters from Sentence")
-                st.json(st.session_state['extracted_payload'])
+            natural_language_form()
 
         with col2:
             if data:
@@ -196,46 +187,141 @@ def main():
             display_events(data)
 
 
+# Input widgets rerun only their own column (fragment); a successful search triggers one
+# full rerun so the map and event columns pick up the new route_data
+@st.fragment
+def manual_search_form(profile_map):
+    #st.subheader("Insert data")
+
+    origin_address = st.text_input("Origin Address", value="Padova")
+    destination_address = st.text_input("Destination Address", value="Verona")
+    buffer_distance = st.number_input("Buffer Distance (km)", min_value=0, value=5)
+
+    query_text = st.text_input("Search Query Text", value="")
+    numevents = st.number_input("Number of Events to Retrieve", min_value=1, value=10)
+
+    profile_choice_user = st.selectbox(
+        "Transport Profile",
+        options=["car", "bike", "walking"],
+        index=0,
+        help="Select the transport profile for routing"
+    )
+
+    start_col1, start_col2 = st.columns(2)
+    with start_col1:
+        # start_date = st.date_input("Start Date", value=datetime.today())
+        start_date = st.date_input("Start Date", value=datetime.today())
+
+    with start_col2:
+        if 'start_time' not in st.session_state:
+            st.session_state.start_time = datetime.now().time()
+        start_time = st.time_input("Start Time", key='start_time')
+
+    end_col1, end_col2 = st.columns(2)
+    with end_col1:
+        end_date = st.date_input("End Date", value=datetime.today() + timedelta(days=4))
+    with end_col2:
+        if 'end_time' not in st.session_state:
+            st.session_state.end_time = datetime.now().time()
+        end_time = st.time_input("End Time", key='end_time')
+
+    error_msgs = []
+    if end_date < start_date:
+        error_msgs.append("End Date cannot be earlier than Start Date.")
+    if end_date == start_date and end_time < start_time:
+        error_msgs.append("If Start Date and End Date are the same, End Time cannot be earlier than Start Time.")
+
+    if error_msgs:
+        for msg in error_msgs:
+            st.error(msg)
+    else:
+        startinputdate = datetime.combine(start_date, start_time).isoformat()
+        endinputdate = datetime.combine(end_date, end_time).isoformat()
+
+    search_disabled = len(error_msgs) > 0
+
+
+    if st.button("Search Events", disabled=search_disabled):
+        payload = {
+            "origin_address": origin_address,
+            "destination_address": destination_address,
+            "buffer_distance": buffer_distance,
+            "startinputdate": startinputdate,
+            "endinputdate": endinputdate,
+            "query_text": query_text,
+            "numevents": numevents,
+            "profile_choice": profile_map.get(profile_choice_user, "driving-car"),
+        }
+
+        data = call_create_map(payload)
+
+        if data:
+            store_route_data(data)
+            st.session_state["route_addresses"] = (origin_address, destination_address)
+            st.rerun()  # full run: redraw the map and event columns
+
+
+@st.fragment
+def natural_language_form():
+    st.subheader("Natural Language Input")
+
+    sentence_input = st.text_area(
+        "Enter your travel plan as a sentence",
+        height=200,
+        placeholder=(
+            "Always specify the year in the dates and the type of transport (car, bike, or foot).\n"
+            "Example: I want to go from Vicenza to Trento "
+            "and will leave on 2 September 2025 at 2 a.m., arriving on 18 October 2025 at 5:00 a.m."
+            "Give me 10 events about music within a 6 km range. Use bike as transport."
+        )
+    )
+    
+    if st.button("Parse and Search"):
+        if not sentence_input.strip():
+            st.error("Please enter a sentence.")
+            st.session_state['extracted_payload'] = None
+        else:
+            extracted_payload = call_sentence_to_payload(sentence_input)
+            if extracted_payload:
+                st.session_state['extracted_payload'] = extracted_payload
+                data = call_create_map(extracted_payload)
+                if data:
+                    store_route_data(data)
+                    st.rerun()  # full run: redraw the map and event columns
+            else:
+                st.session_state['extracted_payload'] = None
+
+    # Display extracted JSON below the button
+    if 'extracted_payload' in st.session_state and st.session_state['extracted_payload'] is not None:
+        st.subheader("Extracted Parameters from Sentence")
+        st.json(st.session_state['extracted_payload'])
+
+
+def store_route_data(data):
+    """Keep a create_map response for the map/event columns, with a digest that keys the map cache."""
+    st.session_state["route_data"] = data
+    st.session_state["route_data_key"] = hashlib.blake2b(orjson.dumps(data), digest_size=8).hexdigest()
+
+
 def display_map_and_events(data, origin_address, destination_address):
     st.subheader("Route Map")
+    html = build_map_html(st.session_state["route_data_key"], data, origin_address, destination_address)
+    components.html(html, height=720, scrolling=True)
 
-    route_coords = [[lon, lat] for lat, lon in [(c[1], c[0]) for c in data['route_coords']]]
-    route_geojson = {
-        "type": "Feature",
-        "geometry": {
-            "type": "LineString",
-            "coordinates": route_coords
-        }
-    }
 
-    markers = []
-    for event in data.get('events', []):
-        lat = event.get('lat') or event.get('latitude')
-        lon = event.get('lon') or event.get('longitude')
-        if lat is None or lon is None:
-            continue
-        markers.append({
-            "title": event.get("title", "No Title"),
-            "address": event.get("address", ""),
-            "description": event.get("description", ""),
-            "start_date": event.get("start_date", "N/A"),
-            "end_date": event.get("end_date", "N/A"),
-            "url": event.get("url", "N/A"),
-            "credits": event.get("credits", ""),
-            "coordinates": [lon, lat]
-        })
+def js_literal(value):
+    """orjson-encoded JS literal; '</' is escaped so event text can't close the <script>."""
+    return orjson.dumps(value).decode().replace("</", "<\\/")
 
-    origin_marker = [data['origin']['lon'], data['origin']['lat']]
-    destination_marker = [data['destination']['lon'], data['destination']['lat']]
-    buffer_polygon_coords = data['buffer_polygon']
 
-    openlayers_html = f"""
+# Static parts of the map page; only the data literals between them change per route
+OL_PAGE_HEAD = f"""
     <!DOCTYPE html>
     <html lang="en">
     <head>
         <meta charset="utf-8" />
         <title>OpenLayers in Streamlit</title>
-        <link rel="stylesheet" href="https://cdn.jsdelivr.net/npm/ol@7.3.0/ol.css" type="text/css" />
+        <link rel="stylesheet" href="{OL_CSS_URL}" type="text/css" />
         <style>
             #map {{
                 width: 100%;
@@ -274,92 +360,88 @@ def display_map_and_events(data, origin_address, destination_address):
                 margin-left: -11px;
             }}
         </style>
-        <script src="https://cdn.jsdelivr.net/npm/ol@7.3.0/dist/ol.js"></script>
+        <script src="{OL_JS_URL}"></script>
     </head>
     <body>
         <div id="map"></div>
         <script type="text/javascript">
-            const routeGeoJSON = {json.dumps(route_geojson)};
-            const markers = {json.dumps(markers)};
-            const origin = {json.dumps(origin_marker)};
-            const destination = {json.dumps(destination_marker)};
-            const origin_address = {json.dumps(origin_address)};
-            const destination_address = {json.dumps(destination_address)};
-            const bufferCoords = {json.dumps([buffer_polygon_coords])};
-
-            const routeFeature = new ol.format.GeoJSON().readFeature(routeGeoJSON, {{
-                featureProjection: "EPSG:3857"
-            }});
-
-            const bufferFeature = new ol.Feature({{
+"""
+
+OL_PAGE_TAIL = """
+
+            const routeFeature = new ol.Feature({
+                geometry: new ol.geom.LineString(routeCoords).transform('EPSG:4326', 'EPSG:3857')
+            });
+
+            const bufferFeature = new ol.Feature({
                 geometry: new ol.geom.Polygon(bufferCoords).transform('EPSG:4326', 'EPSG:3857')
-            }});
+            });
 
-            const bufferLayer = new ol.layer.Vector({{
-                source: new ol.source.Vector({{
+            const bufferLayer = new ol.layer.Vector({
+                source: new ol.source.Vector({
                     features: [bufferFeature]
-                }}),
-                style: new ol.style.Style({{
-                    stroke: new ol.style.Stroke({{
+                }),
+                style: new ol.style.Style({
+                    stroke: new ol.style.Stroke({
                         color: 'red',
                         width: 2
-                    }}),
-                    fill: new ol.style.Fill({{
+                    }),
+                    fill: new ol.style.Fill({
                         color: 'rgba(255, 0, 0, 0.1)'
-                    }})
-                }})
-            }});
+                    })
+                })
+            });
 
-            const routeLayer = new ol.layer.Vector({{
-                source: new ol.source.Vector({{
+            const routeLayer = new ol.layer.Vector({
+                source: new ol.source.Vector({
                     features: [routeFeature]
-                }}),
-                style: new ol.style.Style({{
-                    stroke: new ol.style.Stroke({{
+                }),
+                style: new ol.style.Style({
+                    stroke: new ol.style.Stroke({
                         color: 'blue',
                         width: 4
-                    }})
-                }})
-            }});
+                    })
+                })
+            });
 
-            const iconStyleOrigin = new ol.style.Style({{
-                image: new ol.style.Icon({{
+            const iconStyleOrigin = new ol.style.Style({
+                image: new ol.style.Icon({
                     anchor: [0.5, 1],
                     src: 'https://raw.githubusercontent.com/tatankam/eventmap/refs/heads/main/frontend/icons/start.png',
                     color: 'green'
-                }})
-            }});
-            const iconStyleDestination = new ol.style.Style({{
-                image: new ol.style.Icon({{
+                })
+            });
+            const iconStyleDestination = new ol.style.Style({
+                image: new ol.style.Icon({
                     anchor: [0.5, 1],
                     src: 'https://raw.githubusercontent.com/tatankam/eventmap/refs/heads/main/frontend/icons/stop.png',
                     color: 'red'
-                }})
-            }});
-            const iconStyleEvent = new ol.style.Style({{
-                image: new ol.style.Icon({{
+                })
+            });
+            const iconStyleEvent = new ol.style.Style({
+                image: new ol.style.Icon({
                     anchor: [0.5, 1],
                     src: 'https://raw.githubusercontent.com/tatankam/eventmap/refs/heads/main/frontend/icons/event.png',
                     scale: 1.4
-                }})
-            }});
+                })
+            });
 
-            const originFeature = new ol.Feature({{
+            const originFeature = new ol.Feature({
                 geometry: new ol.geom.Point(ol.proj.fromLonLat(origin)),
                 name: "Origin",
                 description: origin_address
-            }});
+            });
             originFeature.setStyle(iconStyleOrigin);
 
-            const destinationFeature = new ol.Feature({{
+            const destinationFeature = new ol.Feature({
                 geometry: new ol.geom.Point(ol.proj.fromLonLat(destination)),
                 name: "Destination",
                 description: destination_address
-            }});
+            });
             destinationFeature.setStyle(iconStyleDestination);
 
-            const eventFeatures = markers.map(marker => {{
-                const feat = new ol.Feature({{
+            const eventFeatures = markers.map(marker => {
+                const feat = new ol.Feature({
                     geometry: new ol.geom.Point(ol.proj.fromLonLat(marker.coordinates)),
                     name: marker.title,
                     description: marker.description,
@@ -368,70 +450,70 @@ def display_map_and_events(data, origin_address, destination_address):
                     end_date: marker.end_date,
                     credits: marker.credits,
                     url: marker.url
-                }});
+                });
                 feat.setStyle(iconStyleEvent);
                 return feat;
-            }});
+            });
 
-            const markersLayer = new ol.layer.Vector({{
-                source: new ol.source.Vector({{
+            const markersLayer = new ol.layer.Vector({
+                source: new ol.source.Vector({
                     features: [originFeature, destinationFeature, ...eventFeatures]
-                }})
-            }});
+                })
+            });
 
-            const map = new ol.Map({{
+            const map = new ol.Map({
                 target: 'map',
                 layers: [
-                    new ol.layer.Tile({{
+                    new ol.layer.Tile({
                         source: new ol.source.OSM()
-                    }}),
+                    }),
                     bufferLayer,
                     routeLayer,
                     markersLayer
                 ],
-                view: new ol.View({{
+                view: new ol.View({
                     center: ol.proj.fromLonLat([0, 0]),
                     zoom: 2
-                }})
-            }});
+                })
+            });
 
             const extent = routeFeature.getGeometry().getExtent();
-            map.getView().fit(extent, {{ padding: [50, 50, 50, 50], maxZoom: 15 }});
+            map.getView().fit(extent, { padding: [50, 50, 50, 50], maxZoom: 15 });
 
             const container = document.createElement('div');
             container.className = 'ol-popup';
             container.style.display = 'none';
             document.body.appendChild(container);
 
-            const popup = new ol.Overlay({{
+            const popup = new ol.Overlay({
                 element: container,
                 positioning: 'bottom-center',
                 stopEvent: false,
                 offset: [0, -20],
-            }});
+            });
             map.addOverlay(popup);
 
-            map.on('click', function(evt) {{
-                const feature = map.forEachFeatureAtPixel(evt.pixel, function(f) {{ return f; }});
-                if (feature && feature.get('name')) {{
+            map.on('click', function(evt) {
+                const feature = map.forEachFeatureAtPixel(evt.pixel, function(f) { return f; });
+                if (feature && feature.get('name')) {
                     const coordinates = feature.getGeometry().getCoordinates();
                     const props = feature.getProperties();
                     popup.setPosition(coordinates);
                     container.style.display = 'block';
 
-                    if (props.name === "Origin" || props.name === "Destination") {{
-                        container.innerHTML = `<b>${{props.name}}</b><br>${{props.description}}`;
-                    }} else {{
-                        container.innerHTML = `<b>${{props.name}}</b><br>
-                                               <i>${{props.address}}</i><br>
-                                               ${{props.description}}<br>
+                    if (props.name === "Origin" || props.name === "Destination") {
+                        container.innerHTML = `<b>${props.name}</b><br>${props.description}`;
+                    } else {
+                        container.innerHTML = `<b>${props.name}</b><br>
+                                               <i>${props.address}</i><br>
+                                               ${props.description}<br>
                                                 <br>
-                                               <small>Start: ${{props.start_date}} | End: ${{props.end_date}}</small><br>
-                                                                                                <a href="${{props.url}}" target="_blank">link</a><br>
+                                               <small>Start: ${props.start_date} | End: ${props.end_date}</small><br>
+                                                                                                <a href="${props.url}" target="_blank">link</a><br>
                                                                                                 <br>
-                                                                                                <small>Credits:${{props.credits}}</small>`;
+                                                                                                <small>Credits:${props.credits}</small>`;
                                         
-                    }}
+                    }
 
                     const mapSize = map.getSize();
                     const pixel = map.getPixelFromCoordinate(coordinates);
@@ -442,45 +524,111 @@ def display_map_and_events(data, origin_address, destination_address):
                     let offsetX = 0;
                     let offsetY = 0;
 
-                    if (pixel[0] + popupWidth / 2 > mapSize[0]) {{
+                    if (pixel[0] + popupWidth / 2 > mapSize[0]) {
                         offsetX = pixel[0] + popupWidth / 2 - mapSize[0] + margin;
-                    }} else if (pixel[0] - popupWidth / 2 < 0) {{
+                    } else if (pixel[0] - popupWidth / 2 < 0) {
                         offsetX = pixel[0] - popupWidth / 2 - margin;
-                    }}
+                    }
 
-                    if (pixel[1] - popupHeight < 0) {{
+                    if (pixel[1] - popupHeight < 0) {
                         offsetY = pixel[1] - popupHeight - margin;
-                    }}
+                    }
 
-                    if (offsetX !== 0 || offsetY !== 0) {{
+                    if (offsetX !== 0 || offsetY !== 0) {
                         const newCenterPixel = [
                             pixel[0] - offsetX,
                             pixel[1] - offsetY
                         ];
                         const newCenter = map.getCoordinateFromPixel(newCenterPixel);
-                        map.getView().animate({{center: newCenter, duration: 300}});
-                    }}
-                }} else {{
+                        map.getView().animate({center: newCenter, duration: 300});
+                    }
+                } else {
                     container.style.display = 'none';
-                }}
-            }});
+                }
+            });
 
-            map.on('pointermove', function(evt) {{
-                if (evt.dragging) {{
+            map.on('pointermove', function(evt) {
+                if (evt.dragging) {
                     return;
-                }}
-                const hit = map.forEachFeatureAtPixel(evt.pixel, function(feature) {{
+                }
+                const hit = map.forEachFeatureAtPixel(evt.pixel, function(feature) {
                     const name = feature.get('name');
                     return name === 'Origin' || name === 'Destination' || (name && name !== '');
-                }});
+                });
                 map.getTargetElement().style.cursor = hit ? 'pointer' : '';
-            }});
+            });
         </script>
     </body>
     </html>
-    """
+"""
 
-    components.html(openlayers_html, height=720, scrolling=True)
+
+# Reruns triggered by unrelated widgets redraw the same route: reuse the built page
+# instead of re-serializing route, buffer and markers every time. Keyed on the digest
+# taken once in store_route_data; `_data` (underscore) is not hashed by Streamlit.
+@st.cache_data(ttl=60 * 60, max_entries=32, show_spinner=False)
+def build_map_html(route_data_key, _data, origin_address, destination_address):
+    data = _data
+    # Already [lon, lat] pairs: fed straight to an ol.geom.LineString
+    route_coords = data['route_coords']
+
+    markers = []
+    for event in data.get('events', []):
+        lat = event.get('lat') or event.get('latitude')
+        lon = event.get('lon') or event.get('longitude')
+        if lat is None or lon is None:
+            continue
+        markers.append({
+            "title": event.get("title", "No Title"),
+            "address": event.get("address", ""),
+            "description": event.get("description", ""),
+            "start_date": event.get("start_date", "N/A"),
+            "end_date": event.get("end_date", "N/A"),
+            "url": event.get("url", "N/A"),
+            "credits": event.get("credits", ""),
+            "coordinates": [lon, lat]
+        })
+
+    origin_marker = [data['origin']['lon'], data['origin']['lat']]
+    destination_marker = [data['destination']['lon'], data['destination']['lat']]
+    buffer_polygon_coords = data['buffer_polygon']
+
+    openlayers_html = (
+        OL_PAGE_HEAD
+        + f"""
+            const routeCoords = {js_literal(route_coords)};
+            const markers = {js_literal(markers)};
+            const origin = {js_literal(origin_marker)};
+            const destination = {js_literal(destination_marker)};
+            const origin_address = {js_literal(origin_address)};
+            const destination_address = {js_literal(destination_address)};
+            const bufferCoords = {js_literal([buffer_polygon_coords])};
+"""
+        + OL_PAGE_TAIL
+    )
+    return openlayers_html
+
+
+def event_details_html(event):
+    """One collapsible <details> entry (the st.expander layout), user text escaped."""
+    score = event.get('score')  # Adjust the key if needed
+    title = event.get('title', 'No Title')
+    if score is not None:
+        title = f"{title} (Score Fusion RRF: {score:.2f})"
+    parts = [
+        f"<details><summary>{html.escape(str(title))}</summary>",
+        f"<p>{html.escape(str(event.get('address', '')))}</p>",
+        f"<p>{html.escape(str(event.get('description', '')))}</p>",
+        f"<p>Start: {html.escape(str(event.get('start_date', 'N/A')))}  |  End: {html.escape(str(event.get('end_date', 'N/A')))}</p>",
+    ]
+    # Scraped URLs: only http(s) links are rendered (no javascript:/data: hrefs)
+    url = str(event.get('url') or '').strip()
+    if urlsplit(url).scheme.lower() in ('http', 'https'):
+        parts.append(f'<p><a href="{html.escape(url)}" target="_blank" rel="noopener noreferrer">link</a></p>')
+    if event.get('credits'):
+        parts.append(f"<p>Credits: {html.escape(str(event.get('credits', '')))}</p>")
+    parts.append("</details>")
+    return "".join(parts)
 
 
 def display_events(data):
@@ -488,25 +636,10 @@ def display_events(data):
         st.subheader("Events Along Route")
         events = data.get('events', [])
         if events:
-            container = st.container()
-            with container:
-                for event in events:
-                    score = event.get('score')  # Adjust the key if needed
-                    title = event.get('title', 'No Title')
-                    if score is not None:
-                        title = f"{title} (Score Fusion RRF: {score:.2f})"
-                    with st.expander(title):
-                        st.write(event.get('address', ''))
-                        st.write(event.get('description', ''))
-                        st.write(f"Start: {event.get('start_date', 'N/A')}  |  End: {event.get('end_date', 'N/A')}")
-                        st.write(f"[link]({event.get('url', '')})", unsafe_allow_html=True)
-                        if event.get('credits'):
-                            st.write(f"Credits: {event.get('credits', '')}")
-
-
+            # One markdown element for the whole list instead of an expander + 5 writes per event
+            st.markdown("".join(event_details_html(event) for event in events), unsafe_allow_html=True)
         else:
             st.info("No events found for this route in the specified date range.")
 
-
 if __name__ == "__main__":
     main()